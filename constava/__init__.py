@@ -1,2 +1,16 @@
-from .wrapper import Constava, ConstavaParameters
-from .utils.constants import CONSTAVA_VERSION as __version__
\ No newline at end of file
+from .utils.constants import CONSTAVA_VERSION as __version__
+
+__all__ = ["Constava", "ConstavaParameters"]
+
+
+def __getattr__(name):
+    """Imports the wrapper (and with it numpy, pandas and scikit-learn) on 
+    first access to its classes, rather than on `import constava`"""
+    if name in __all__:
+        from . import wrapper
+        return getattr(wrapper, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted([*globals(), *__all__])
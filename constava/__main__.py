@@ -3,9 +3,10 @@ the tool."""
 import os, sys
 import argparse
 import textwrap as tw
-from constava import Constava, ConstavaParameters, __version__
-from constava.tests.tests import run_unittest
-from constava.utils.dihedrals import calculate_dihedrals
+from constava import __version__
+from constava.utils.logging import configure_logging
+# The scientific dependencies (numpy, pandas, scikit-learn, MDAnalysis) are 
+# imported by the subcommands that need them, so `constava -h` starts quickly
 
 
 def parse_parameters(cmdline_arguments):
@@ -116,6 +117,12 @@ def parse_parameters(cmdline_arguments):
         This flag controls how many grid points are used to 
         describe the probability density function. Only applies if
         `--model-type` is set to `grid`. (default: 10000)"""))
+    fitMdl.add_argument("--grid-dtype", choices=["float64", "float32"], default="float64", help=tw.dedent(
+        """\
+        Precision of the grid. `float32` halves the memory of the
+        grid at a small loss of accuracy. Only applies if 
+        `--model-type` is set to `grid`: {'float64', 'float32'}
+        (default: 'float64')"""))
     
     fitMisc = parser_fit_model.add_argument_group("Miscellaneous options")
     fitMisc.add_argument("--degrees", action="store_true", help=tw.dedent(
@@ -154,10 +161,15 @@ def parse_parameters(cmdline_arguments):
         help="Input file(s) that contain the dihedral angles.")
     anaIO.add_argument("--input-format", choices=["auto", "xvg", "csv"], default="auto", 
         help="Format of the input file: {'auto', 'csv', 'xvg'}")
+    anaIO.add_argument("--input-dtype", choices=["float64", "float32"], default="float64", help=tw.dedent(
+        """\
+        Precision in which the input dihedrals are stored. `float32` 
+        halves the memory of large ensembles: {'float64', 'float32'}
+        (default: 'float64')"""))
     anaIO.add_argument("-o", "--output", type=str, metavar="<file.csv>",
         help="The file to write the results to.")
-    anaIO.add_argument("--output-format", choices=["auto", "csv", "json", "tsv"], default="auto",
-        help="Format of output file: {'csv', 'json', 'tsv'}. (default: 'auto')")
+    anaIO.add_argument("--output-format", choices=["auto", "csv", "json", "tsv", "parquet"], default="auto",
+        help="Format of output file: {'csv', 'json', 'tsv', 'parquet'}. (default: 'auto')")
 
     anaMdl = parser_analyze.add_argument_group("Conformational state model options")
     anaMdl.add_argument("-m", "--load-model", type=str, metavar="<file.pkl>", help=tw.dedent(
@@ -239,6 +251,8 @@ def parse_parameters(cmdline_arguments):
         help="If set results are written in degrees instead of radians.")
     dihMisc.add_argument("-O", "--overwrite", action="store_true",
         help="If set any previously generated output will be overwritten.")
+    dihMisc.add_argument("--processes", default=None, type=int,
+        help="Number of processes used to analyze the trajectory. (default: number of CPUs)")
 
     # ======================
     #  Subparser: test
@@ -255,6 +269,7 @@ def parse_parameters(cmdline_arguments):
 
 def run_fit_model(args):
     """Run fit-model subcommand when invoked from command line"""
+    from constava import Constava, ConstavaParameters
     # Initialze and run Constava
     cva = Constava(ConstavaParameters(verbose=args.verbose))
     csmodel = cva.fit_csmodel(
@@ -262,16 +277,19 @@ def run_fit_model(args):
         model_data = args.input,
         kde_bandwidth = args.kde_bandwidth,
         grid_points = args.grid_points,
-        model_data_degrees = args.degrees)
+        model_data_degrees = args.degrees,
+        grid_dtype = args.grid_dtype)
     # Write the fitted model out as a pickle
     csmodel.dump_pickle(args.output)
 
 def run_analyze(args):
     """Run analyze subcommand when invoked from command line."""
+    from constava import Constava, ConstavaParameters
     # Convert command line arguments to ConstavaParameters
     params = ConstavaParameters(verbose=args.verbose)
     params.input_files = args.input
     params.input_format = args.input_format
+    params.input_dtype = args.input_dtype
     params.output_file = args.output
     params.output_format = args.output_format
     params.model_load = args.load_model
@@ -289,19 +307,19 @@ def run_analyze(args):
 
 def run_dihedrals(args):
     """Run analyze subcommand when invoked from command line."""
+    from constava.utils.dihedrals import iterate_dihedrals, write_dihedrals
     # Set output to default value if needed
     args.output = args.output or "dihedrals.csv"
     if not args.overwrite and os.path.exists(args.output):
         raise FileExistsError(f"Cannot overwrite existing file: {args.output}")
-    # Calculate dihedrals
-    dihedrals = calculate_dihedrals(args.structure, args.trajectory, 
-                                    args.selection, args.degrees)
-    # Write results
-    float2str = f"%.{args.precision}f" # Definition of float format in output
-    dihedrals.to_csv(args.output, header=True, index=False, float_format=float2str)
+    # Calculate dihedrals and write results, one block of residues at a time
+    dihedrals = iterate_dihedrals(args.structure, args.trajectory, 
+                                  args.selection, args.degrees, args.processes)
+    write_dihedrals(dihedrals, args.output, args.precision)
 
 def main():
     """main function executed when running script in command line mode"""
+    configure_logging()
     # Parse command line parameters
     args = parse_parameters(sys.argv[1:])
     if args.subcommand == "fit-model":
@@ -311,7 +329,9 @@ def main():
     elif args.subcommand == "dihedrals":
         run_dihedrals(args)
     elif args.subcommand == "test":
-        run_unittest()
+        from constava.tests.tests import run_unittest
+        # The exit status reports failed tests (e.g., to tox)
+        return 0 if run_unittest() else 1
 
 if __name__ == "__main__":
     sys.exit(main())
\ No newline at end of file
@@ -3,7 +3,10 @@ conformational state propensities and conformational state variability from
 a protein ensemble
 """
 
-from typing import List
+import os
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
 import tqdm
 from .subsampling import SubsamplingABC, SubsamplingMethodError
 from .csmodels import ConfStateModelABC
@@ -26,8 +29,11 @@ def check_subsampling_methods(func):
 
 
 class ConfStateCalculator:
+    # Number of residues subsampled together in one batch, after each of which
+    # the progress bar is updated
+    BATCH_RESIDUES = 64
 
-    def __init__(self, csmodels: ConfStateModelABC, methods: List[SubsamplingABC] = None):
+    def __init__(self, csmodels: ConfStateModelABC, methods: List[SubsamplingABC] = None, n_workers: int = None):
         """Initializes the calcualtor class with given conformational state 
         models (csmodels) and zero or more subsampling methods.
 
@@ -38,9 +44,14 @@ class ConfStateCalculator:
 
             methods : List[SubsamplingABC] = None
                 (Optional) A list of subsampling methods to use in the calculation.
+
+            n_workers : int = None
+                (Optional) Number of threads used to process residues in 
+                parallel. If None, the number of CPUs is used.
         """
         self.csmodels = csmodels
         self.methods = methods or []
+        self.n_workers = n_workers
 
     def add_method(self, new_method: SubsamplingABC):
         """Adds a new subsampling methods to the calculator."""
@@ -70,13 +81,48 @@ class ConfStateCalculator:
             for method in self.methods
         ]
 
-        for res in tqdm.tqdm(ensemble.get_residues(), total=ensemble.n_residues, unit='residues'):
-            logpdf = self.csmodels.get_logpdf(res.phipsi)
+        residues = list(ensemble.get_residues())
+        if not residues:
+            return results
+        n_workers = self.n_workers or os.cpu_count() or 1
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            # Residues are scored in one model call per worker, rather than 
+            # one call per residue
+            chunk_size = -(-len(residues) // n_workers)
+            chunks = [residues[i:i+chunk_size] for i in range(0, len(residues), chunk_size)]
+            logpdfs = [
+                logpdf for chunk_logpdfs in executor.map(
+                    lambda chunk: self.csmodels.get_logpdf_batch([res.phipsi for res in chunk]), chunks)
+                for logpdf in chunk_logpdfs
+            ]
+            if len({logpdf.shape for logpdf in logpdfs}) == 1:
+                # All residues have the same number of frames, so they are 
+                # subsampled together in batches of Array[R,M,N]
+                residue_results = []
+                with tqdm.tqdm(total=ensemble.n_residues, unit='residues') as progress:
+                    for start in range(0, len(logpdfs), self.BATCH_RESIDUES):
+                        batch = np.stack(logpdfs[start:start+self.BATCH_RESIDUES])
+                        pdf_cache = {}
+                        method_results = [method.calculateBatch(batch, cache=pdf_cache) for method in self.methods]
+                        residue_results.extend(zip(*method_results))
+                        progress.update(len(batch))
+            else:
+                # Residues are independent, so they are processed in a thread pool
+                residue_results = list(tqdm.tqdm(
+                    executor.map(self._calculate_residue, logpdfs),
+                    total=ensemble.n_residues, unit='residues'))
 
-            for method, result in zip(self.methods, results):
-                state_propensities, state_variability = method.calculate(logpdf)
+        for res, res_results in zip(residues, residue_results):
+            for (state_propensities, state_variability), result in zip(res_results, results):
                 result.add_entry(ConstavaResultsEntry(
                     res, state_propensities, state_variability))
                 
         return results
 
+    def _calculate_residue(self, logpdf) -> List[Tuple]:
+        """Calculates the state propensities and state variability of a 
+        single residue from its logPDFs for all subsampling methods."""
+        # Methods with the same subsampling scheme share their likelihoods
+        pdf_cache = {}
+        return [method.calculate(logpdf, cache=pdf_cache) for method in self.methods]
+
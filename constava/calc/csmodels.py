@@ -6,6 +6,8 @@ import abc
 import json
 import pickle
 import math
+import os
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Tuple
 import numpy as np
 from scipy.interpolate import interpn
@@ -55,6 +57,25 @@ class ConfStateModelABC(metaclass=abc.ABCMeta):
                 state models across the N original observations.
         """
         pass
+
+    def get_logpdf_batch(self, datas: List[np.ndarray]) -> List[np.ndarray]:
+        """Inference of log-probability densities for multiple sets of 
+        observations (e.g., several residues) in a single call of the model.
+        
+        Parameters:
+        -----------
+            datas : List[Array[N_i,2]]
+                Sets of N_i original observations of (phi, psi) angle pairs.
+        
+        Returns:
+        --------
+            logpdfs : List[Array[M,N_i]]
+                Log-Probability densities for all M probabilistic conformational
+                state models across the N_i observations of each set.
+        """
+        sizes = [len(data) for data in datas]
+        logpdf = self.get_logpdf(np.concatenate(datas))
+        return np.split(logpdf, np.cumsum(sizes)[:-1], axis=1)
     
     @abc.abstractclassmethod
     def from_fitting(cls, training_data_json: str, **kwargs):
@@ -69,7 +90,7 @@ class ConfStateModelABC(metaclass=abc.ABCMeta):
                 File path to store the model at.
         """
         with open(output_file, "wb") as fhandle:
-            pickle.dump(self, fhandle)
+            pickle.dump(self, fhandle, protocol=pickle.HIGHEST_PROTOCOL)
 
     @classmethod
     def from_pickle(cls, pickled_file: str):
@@ -133,9 +154,9 @@ class ConfStateModelKDE(ConfStateModelABC):
         self.state_kdes = tuple(state_kdes)
 
     def get_logpdf(self, data: np.ndarray) -> np.ndarray:
-        result = np.stack([
-            kde.score_samples(data) for kde in self.state_kdes
-        ])
+        result = np.empty((len(self.state_kdes), len(data)))
+        for i, kde in enumerate(self.state_kdes):
+            result[i] = kde.score_samples(data)
         return result
 
     @classmethod
@@ -212,13 +233,41 @@ class ConfStateModelGrid(ConfStateModelABC):
         self.grid_crds = grid_crds
     
     def get_logpdf(self, data: np.ndarray) -> np.ndarray:
-        result = np.stack([
-            interpn(self.grid_crds, grid, data) for grid in self.state_grids
-        ])
+        phi_crds, psi_crds = self.grid_crds
+        if not (self._is_uniform(phi_crds) and self._is_uniform(psi_crds)):
+            # All states are interpolated in a single call by moving the state 
+            # axis last: Array[N,N,M] -> Array[X,M]
+            result = interpn(self.grid_crds, np.moveaxis(self.state_grids, 0, -1), data)
+            return np.ascontiguousarray(result.T)
+        # Bilinear interpolation on the uniform grid, for all states at once
+        i, fu = self._grid_position(phi_crds, data[:,0])
+        j, fv = self._grid_position(psi_crds, data[:,1])
+        grids = self.state_grids
+        result = grids[:, i, j] * ((1 - fu) * (1 - fv))
+        result += grids[:, i+1, j] * (fu * (1 - fv))
+        result += grids[:, i, j+1] * ((1 - fu) * fv)
+        result += grids[:, i+1, j+1] * (fu * fv)
         return result
+
+    @staticmethod
+    def _is_uniform(crds: np.ndarray) -> bool:
+        """Checks if the grid coordinates are evenly spaced"""
+        return len(crds) > 1 and np.allclose(np.diff(crds), (crds[-1] - crds[0]) / (len(crds) - 1))
+
+    @staticmethod
+    def _grid_position(crds: np.ndarray, values: np.ndarray):
+        """Returns the indices of the grid cells the values fall into, and the
+        relative position of the values within those cells. NaN values pass the
+        bounds check; they are given the first cell and a NaN position, so 
+        their interpolated values are NaN, rather than read out of bounds."""
+        if np.any(values < crds[0]) or np.any(values > crds[-1]):
+            raise ValueError("One of the requested xi is out of bounds")
+        pos = (values - crds[0]) * ((len(crds) - 1) / (crds[-1] - crds[0]))
+        idx = np.minimum(np.where(np.isnan(pos), 0, pos).astype(np.intp), len(crds) - 2)
+        return idx, pos - idx
     
     @classmethod
-    def from_fitting(cls, training_data_json: str, *, in_degrees=False, bandwidth=.13, grid_points=10_000, **_):
+    def from_fitting(cls, training_data_json: str, *, in_degrees=False, bandwidth=.13, grid_points=10_000, dtype=np.float64, **_):
         """Generate the probabilistic models at runtime, by fitting the models
         to the provided training data. Training data must be a json.
         
@@ -235,6 +284,9 @@ class ConfStateModelGrid(ConfStateModelABC):
                 by interpolation. Note, that for generating the grid for both 
                 axes sqrt(`grid_points`) are used. Thus, if `grid_points` is not 
                 a square number, the final grid_points may be less.
+            dtype : np.dtype
+                Data type in which the grids are stored. `np.float32` halves the
+                memory traffic during interpolation at the cost of precision.
 
         Returns:
         --------
@@ -251,5 +303,10 @@ class ConfStateModelGrid(ConfStateModelABC):
         # Infer PDF grid from a KDE model
         kde_model = ConfStateModelKDE.from_fitting(training_data_json, bandwidth=.13, in_degrees=in_degrees)
         _labels = kde_model.get_labels()
-        _grids = np.reshape(kde_model.get_logpdf(gridcrds), (-1,n,n), order="C")
+        # The states are independent, so their grids are scored in a thread pool
+        _grids = np.empty((len(kde_model.state_kdes), n, n), dtype=dtype)
+        def _score_grid(i, kde):
+            _grids[i] = np.reshape(kde.score_samples(gridcrds), (n,n), order="C")
+        with ThreadPoolExecutor(max_workers=os.cpu_count() or 1) as executor:
+            list(executor.map(_score_grid, range(len(_grids)), kde_model.state_kdes))
         return cls(state_labels=_labels, state_grids=_grids, grid_crds=(_phi, _psi))
\ No newline at end of file
@@ -5,11 +5,46 @@ dynamically defined on run-time."""
 import abc
 import numpy as np
 from typing import Optional
+try:
+    from numba import njit
+except ImportError: # numba is optional, numpy is used as a fallback
+    njit = None
 
 class SubsamplingMethodError(ValueError):
     """Raised when there are no subsampling methods passed to the calculator"""
     pass
 
+if njit is not None:
+    @njit(cache=True, nogil=True)
+    def _bootstrap_sum(logpdfs, samples, sample_size, out):
+        """Sums the logPDFs of the bootstrapped samples without materializing
+        the gathered Array[R,M,n_samples,sample_size]. `samples` holds the
+        indices of all samples back to back. Values are accumulated in the 
+        same order as numpy does for the gathered array."""
+        n_residues, n_states, _ = logpdfs.shape
+        n_samples = out.shape[2]
+        for r in range(n_residues):
+            for m in range(n_states):
+                row = logpdfs[r, m]
+                for k in range(n_samples):
+                    start = k * sample_size
+                    acc = row[samples[start]]
+                    for j in range(start + 1, start + sample_size):
+                        acc += row[samples[j]]
+                    out[r, m, k] = acc
+        return out
+else:
+    _bootstrap_sum = None
+
+def _softmax(logpdf, axis: int = 0):
+    """Exponentiates and normalizes the logPDFs along the axis of the states 
+    (in place). The maximum is subtracted first, so large logPDFs do not 
+    overflow and small ones do not all underflow to zero."""
+    logpdf -= np.max(logpdf, axis=axis, keepdims=True)
+    pdf = np.exp(logpdf, out=logpdf)
+    pdf /= np.sum(pdf, axis=axis, keepdims=True)
+    return pdf
+
 class SubsamplingABC(metaclass=abc.ABCMeta):
     """Base class to subsample the logPDF values obtained from the probabilistic 
     conformational state models and calculate the conformational state 
@@ -20,16 +55,23 @@ class SubsamplingABC(metaclass=abc.ABCMeta):
         calculate(state_logpdfs)
             Calculates the conformational state likelihoods and conformational
             state variability.
+        calculateBatch(state_logpdfs)
+            Calculates the conformational state likelihoods and conformational
+            state variability for multiple residues at once.
         calculateStatePropensities(state_likelihoods)
             Calculates the average conformational state likelihood.
         calculateStateVariability(state_likelihoods)
             Calculates the  conformational state variability.
         getShortName()
             Name of the method for reference in the output.
+        getSubsamplingKey()
+            Key identifying the subsampling scheme (used for caching).
         _subsampling(state_logpdfs)
             Subsamples from the distribution of original data points.
+        _subsamplingBatch(state_logpdfs)
+            Subsamples from the distributions of multiple residues at once.
     """
-    def calculate(self, state_logpdfs):
+    def calculate(self, state_logpdfs, cache: Optional[dict] = None):
         """Calculates the conformational state likelihoods and conformational
         state variability from the sampled state logPDFs.
 
@@ -37,6 +79,11 @@ class SubsamplingABC(metaclass=abc.ABCMeta):
         -----------
             state_logpdfs : Array[M, N]
                                 An array of the logPDFs of N samples for M states
+            cache : dict
+                                (Optional) Dictionary shared by all methods 
+                                applied to the same state_logpdfs. Methods with
+                                the same subsampling scheme reuse the subsampled
+                                likelihoods instead of recomputing them.
 
         Returns:
         --------
@@ -48,11 +95,45 @@ class SubsamplingABC(metaclass=abc.ABCMeta):
                                 throughout the sampling
             
         """
-        subsampled_pdf = self._subsampling(state_logpdfs)
+        subsampled_pdf = self._cachedSubsampling(self._subsampling, state_logpdfs, cache)
         state_propensities = self.calculateStatePropensities(subsampled_pdf)
         state_variability  = self.calculateStateVariability(subsampled_pdf)
         return state_propensities, state_variability
 
+    def calculateBatch(self, state_logpdfs, cache: Optional[dict] = None):
+        """Calculates the conformational state likelihoods and conformational
+        state variability for R residues with the same number of samples.
+
+        Parameters:
+        -----------
+            state_logpdfs : Array[R, M, N]
+                                An array of the logPDFs of N samples for M states
+                                for each of the R residues
+            cache : dict
+                                (Optional) Dictionary shared by all methods 
+                                applied to the same state_logpdfs.
+
+        Returns:
+        --------
+            results : List[Tuple[state_propensities, state_variability]]
+                                The results of `calculate` for each residue
+        """
+        subsampled_pdfs = self._cachedSubsampling(self._subsamplingBatch, state_logpdfs, cache)
+        return [
+            (self.calculateStatePropensities(pdf), self.calculateStateVariability(pdf))
+            for pdf in subsampled_pdfs
+        ]
+
+    def _cachedSubsampling(self, subsampling_func, state_logpdfs, cache: Optional[dict]):
+        """Applies the subsampling function, reusing results from the cache of
+        methods with the same subsampling scheme."""
+        key = self.getSubsamplingKey()
+        if cache is None or key is None:
+            return subsampling_func(state_logpdfs)
+        elif key not in cache:
+            cache[key] = subsampling_func(state_logpdfs)
+        return cache[key]
+
     def calculateStatePropensities(self, state_likelihoods):
         """Calculates the average conformational state likelihood."""
         return np.mean(state_likelihoods, axis=1)
@@ -72,9 +153,9 @@ class SubsamplingABC(metaclass=abc.ABCMeta):
             state_var : float
                 Conformational state variability
         """
-        mean_likelihoods = np.mean(state_likelihoods, axis=1)
-        squard_dev = np.sum((state_likelihoods.T - mean_likelihoods) ** 2, axis=1)
-        state_var = np.sqrt(np.mean(squard_dev))
+        # Mean over samples of the squared deviations summed over states is 
+        # the sum of the per-state variances
+        state_var = np.sqrt(np.sum(np.var(state_likelihoods, axis=1)))
         return state_var
 
     @abc.abstractmethod
@@ -82,6 +163,12 @@ class SubsamplingABC(metaclass=abc.ABCMeta):
         """Name of the method for reference in the output."""
         pass
 
+    def getSubsamplingKey(self) -> Optional[tuple]:
+        """Key identifying the subsampling scheme. Methods with equal keys 
+        produce identical subsampled likelihoods for the same input. Returns 
+        None if the results should not be shared."""
+        return None
+
     @abc.abstractmethod
     def _subsampling(self, logpdf):
         """Method used to subsample from the distribution of logPDF values and 
@@ -100,6 +187,23 @@ class SubsamplingABC(metaclass=abc.ABCMeta):
         """
         pass
 
+    def _subsamplingBatch(self, logpdfs):
+        """Subsamples the logPDF values of R residues at once. By default, the
+        residues are subsampled one by one.
+
+        Parameters:
+        -----------
+            logpdfs : Array[R,M,X]
+                log-probability densities for M states across X original data 
+                points for each of the R residues.
+        
+        Retruns:
+        --------
+            pdfs : Array[R,M,N]
+                Likelihoods obtained by subsampling N times for each residue.
+        """
+        return np.stack([self._subsampling(logpdf) for logpdf in logpdfs])
+
 
 class SubsamplingWindow(SubsamplingABC):
     """Class to subsample the logPDF values obtained from the probabilistic 
@@ -117,14 +221,21 @@ class SubsamplingWindow(SubsamplingABC):
         calculate(state_logpdfs)
             Calculates the conformational state likelihoods and conformational
             state variability.
+        calculateBatch(state_logpdfs)
+            Calculates the conformational state likelihoods and conformational
+            state variability for multiple residues at once.
         calculateStatePropensities(state_likelihoods)
             Calculates the average conformational state likelihood.
         calculateStateVariability(state_likelihoods)
             Calculates the  conformational state variability.
         getShortName()
             Name of the method for reference in the output.
+        getSubsamplingKey()
+            Key identifying the subsampling scheme (used for caching).
         _subsampling(state_logpdfs)
             Subsamples from the distribution of original data points.
+        _subsamplingBatch(state_logpdfs)
+            Subsamples from the distributions of multiple residues at once.
     """
     def __init__(self, window_size: int):
         """Inititialize class to subsample and calcualte conformational state 
@@ -142,6 +253,10 @@ class SubsamplingWindow(SubsamplingABC):
         """Name of the method for reference in the output."""
         return f"window/{self.window_size:d}/"
 
+    def getSubsamplingKey(self) -> Optional[tuple]:
+        """Key identifying the subsampling scheme (used for caching)."""
+        return ("window", self.window_size)
+
     def _subsampling(self, logpdf):
         """Subsampling from the distribution of logPDF using a sliding window of 
         size `window_size`. With a `window_size == 1`, this effectively uses the
@@ -158,14 +273,13 @@ class SubsamplingWindow(SubsamplingABC):
             pdf : Array[M,N]
                 Likelihoods obtained by subsampling N times using the described method.
         """
-        # Subsampling using consecutive windows of window_size samples
-        logpdf = np.stack([
-            np.convolve(x, np.ones((self.window_size,)), mode="valid") 
-            for x in logpdf])
+        # Subsampling using consecutive windows of window_size samples. The
+        # window sums are differences of the cumulative sums along each row.
+        csum = np.cumsum(logpdf, axis=1)
+        windowed = csum[:, self.window_size-1:]
+        windowed[:, 1:] -= csum[:, :-self.window_size]
         # Exponentiate and normalize to obtain likelihoods
-        pdf = np.exp(logpdf)
-        pdf /= np.sum(pdf, axis=0)
-        return pdf
+        return _softmax(windowed, axis=0)
 
 
 class SubsamplingBootstrap(SubsamplingABC):
@@ -182,21 +296,33 @@ class SubsamplingBootstrap(SubsamplingABC):
             Number of samples to bootstrap.
         seed: int
             Random seed used during bootstrapping
+        BATCH_BYTES : int
+            Upper bound for the intermediate array when subsampling multiple
+            residues at once.
     
     Methods:
     --------
         calculate(state_logpdfs)
             Calculates the conformational state likelihoods and conformational
             state variability.
+        calculateBatch(state_logpdfs)
+            Calculates the conformational state likelihoods and conformational
+            state variability for multiple residues at once.
         calculateStatePropensities(state_likelihoods)
             Calculates the average conformational state likelihood.
         calculateStateVariability(state_likelihoods)
             Calculates the  conformational state variability.
         getShortName()
             Name of the method for reference in the output.
+        getSubsamplingKey()
+            Key identifying the subsampling scheme (used for caching).
         _subsampling(state_logpdfs)
             Subsamples from the distribution of original data points.
+        _subsamplingBatch(state_logpdfs)
+            Subsamples from the distributions of multiple residues at once.
     """
+    BATCH_BYTES = 64 * 1024**2
+
     def __init__(self, sample_size: int, n_samples = 500, seed: Optional[int] = None):
         """Inititialize class to subsample and calcualte conformational state 
         propensities and conformational state variability. Subsampling is done 
@@ -214,12 +340,35 @@ class SubsamplingBootstrap(SubsamplingABC):
         self.sample_size = sample_size
         self.n_samples = n_samples
         self.seed = seed
+        self._samples_cache = {}
 
     def getShortName(self) -> str:
         """Name of the method for reference in the output."""
         return "bootstrap/{0:d}/{1:d}/{2}/".format(
             self.sample_size, self.n_samples, self.seed or "")
 
+    def getSubsamplingKey(self) -> Optional[tuple]:
+        """Key identifying the subsampling scheme (used for caching). Without
+        a fixed seed, bootstrapped samples are never shared."""
+        if self.seed is None:
+            return None
+        return ("bootstrap", self.sample_size, self.n_samples, self.seed)
+
+    def _drawSamples(self, n_measurements: int) -> np.ndarray:
+        """Draws the indices of `n_samples` bootstrapped samples of 
+        `sample_size` data points each (back to back). With a fixed seed, the 
+        same indices are drawn for every residue of the same length, so they
+        are drawn once and reused (read-only)."""
+        key = (self.getSubsamplingKey(), n_measurements)
+        samples = self._samples_cache.get(key) if key[0] is not None else None
+        if samples is None:
+            rng = np.random.default_rng(self.seed)
+            samples = rng.integers(n_measurements, size=self.sample_size*self.n_samples)
+            if key[0] is not None:
+                samples.flags.writeable = False
+                self._samples_cache[key] = samples
+        return samples
+
     def _subsampling(self, logpdf):
         """Subsampling from the distribution of logPDF using bootstrapping. 
         `n_samples` are subsampled from the distribution, where each sample 
@@ -242,18 +391,57 @@ class SubsamplingBootstrap(SubsamplingABC):
         # Randomly select the <n_samples> samples by bootstrapping, with each
         # sample containing exactly <sample_size> measurements from the original
         # distribution. -> Array[n_states, n_samples, sample_size]
-        rng = np.random.default_rng(self.seed)
-        samples = rng.integers(n_measurements, size=self.sample_size*self.n_samples)
-        logpdf = np.reshape(
-            logpdf[:,samples], (n_states, self.n_samples, self.sample_size), 
-            order="C")
-        # Accumulate logpdfs within a sample = logpdf for each of these samples 
-        # to be sampled from the same conformational state
-        logpdf = np.sum(logpdf, axis=2)
+        samples = self._drawSamples(n_measurements)
+        if _bootstrap_sum is not None:
+            # Fused gather and accumulation of the logpdfs within each sample
+            logpdf = _bootstrap_sum(
+                logpdf[np.newaxis], samples, self.sample_size, 
+                np.empty((1, n_states, self.n_samples)))[0]
+        else:
+            # Indexing with the samples as Array[n_samples, sample_size] gathers
+            # directly into Array[n_states, n_samples, sample_size]. Accumulate 
+            # logpdfs within a sample = logpdf for each of these samples to be 
+            # sampled from the same conformational state
+            samples = samples.reshape(self.n_samples, self.sample_size)
+            logpdf = np.sum(logpdf[:,samples], axis=2)
         # Exponentiate and normalize to obtain likelihoods
-        pdf = np.exp(logpdf)
-        pdf /= np.sum(pdf, axis=0)
-        return pdf
+        return _softmax(logpdf, axis=0)
+
+    def _subsamplingBatch(self, logpdfs):
+        """Subsamples the logPDF values of R residues at once using 
+        bootstrapping. With a fixed seed, every residue would draw the same 
+        samples, so these are drawn once and gathered for all residues. 
+        Without a seed, residues are subsampled independently.
+        
+        Parameters:
+        -----------
+            logpdfs : Array[R,M,X]
+                log-Probability densities for M states across X original data 
+                points for each of the R residues.
+        
+        Retruns:
+        --------
+            pdfs : Array[R,M,N]
+                Likelihoods obtained by subsampling N times for each residue.
+        """
+        if self.seed is None:
+            return super()._subsamplingBatch(logpdfs)
+        n_residues, n_states, n_measurements = logpdfs.shape
+        samples = self._drawSamples(n_measurements)
+        pdfs = np.empty((n_residues, n_states, self.n_samples))
+        if _bootstrap_sum is not None:
+            # Fused gather and accumulation of the logpdfs within each sample
+            pdfs = _bootstrap_sum(logpdfs, samples, self.sample_size, pdfs)
+        else:
+            # Gather residues in chunks to limit the size of the intermediate 
+            # Array[chunk, n_states, n_samples, sample_size]
+            chunk_size = max(1, self.BATCH_BYTES // (8 * n_states * samples.size))
+            samples = samples.reshape(self.n_samples, self.sample_size)
+            for start in range(0, n_residues, chunk_size):
+                chunk = logpdfs[start:start+chunk_size]
+                pdfs[start:start+chunk_size] = np.sum(chunk[:,:,samples], axis=3)
+        # Exponentiate and normalize to obtain likelihoods
+        return _softmax(pdfs, axis=1)
 
 
 class SubsamplingWindowSeries(SubsamplingWindow):
@@ -272,14 +460,21 @@ class SubsamplingWindowSeries(SubsamplingWindow):
         calculate(state_logpdfs)
             Calculates the conformational state likelihoods and conformational
             state variability.
+        calculateBatch(state_logpdfs)
+            Calculates the conformational state likelihoods and conformational
+            state variability for multiple residues at once.
         calculateStatePropensities(state_likelihoods)
             Calculates the samples' conformational state likelihood.
         calculateStateVariability(state_likelihoods)
             Calculates the conformational state variability.
         getShortName()
             Name of the method for reference in the output.
+        getSubsamplingKey()
+            Key identifying the subsampling scheme (used for caching).
         _subsampling(state_logpdfs)
             Subsamples from the distribution of original data points.
+        _subsamplingBatch(state_logpdfs)
+            Subsamples from the distributions of multiple residues at once.
     """
 
     def getShortName(self) -> str:
@@ -331,14 +526,21 @@ class SubsamplingBootstrapSeries(SubsamplingBootstrap):
         calculate(state_logpdfs)
             Calculates the conformational state likelihoods and conformational
             state variability.
+        calculateBatch(state_logpdfs)
+            Calculates the conformational state likelihoods and conformational
+            state variability for multiple residues at once.
         calculateStatePropensities(state_likelihoods)
             Calculates the samples' conformational state likelihood.
         calculateStateVariability(state_likelihoods)
             Calculates the conformational state variability.
         getShortName()
             Name of the method for reference in the output.
+        getSubsamplingKey()
+            Key identifying the subsampling scheme (used for caching).
         _subsampling(state_logpdfs)
             Subsamples from the distribution of original data points.
+        _subsamplingBatch(state_logpdfs)
+            Subsamples from the distributions of multiple residues at once.
     """
 
     def getShortName(self) -> str:
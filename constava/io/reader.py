@@ -1,6 +1,7 @@
 """constava.reader contains the reader interface to read input data"""
 
 from typing import List
+import numpy as np
 from .rstrategies import ReaderABC, DihedralCsvReader, GmxChiReader, UnknownFileStructureError
 from ..utils.ensembles import ProteinEnsemble
 
@@ -15,6 +16,10 @@ class EnsembleReader:
             A string to indicate which reader strategy should be used.
         degrees2radians : bool
             Sets if read data should be converted from degrees to radians.
+        dtype : np.dtype
+            Floating point type in which the dihedrals are stored (default: 
+            float64). float32 halves the memory of large ensembles, but the 
+            results are no longer bit-identical.
 
     Methods:
     --------
@@ -32,9 +37,10 @@ class EnsembleReader:
         "xvg": GmxChiReader,
     }
 
-    def __init__(self, filetype_str: str = "auto", degrees2radians: bool = False):
+    def __init__(self, filetype_str: str = "auto", degrees2radians: bool = False, dtype: np.dtype = np.float64):
         self.filetype_str = filetype_str
         self.degrees2radians = degrees2radians
+        self.dtype = dtype
 
     def readFiles(self, *input_files: str) -> ProteinEnsemble:
         """Reads the dihedral angles from one or more input files using an 
@@ -78,14 +84,14 @@ class EnsembleReader:
         """
         filetype = (filetype or "").lower()
         if filetype in self.STRATEGIES:
-            return self.STRATEGIES[filetype](degrees=self.degrees2radians)
+            return self.STRATEGIES[filetype](degrees=self.degrees2radians, dtype=self.dtype)
         elif filetype in ("auto", "guess", ""):
-            return self.guess_strategy(input_files, degrees=self.degrees2radians)
+            return self.guess_strategy(input_files, degrees=self.degrees2radians, dtype=self.dtype)
         else:
             raise ValueError(f"Unknown argument for --input-format flag: `{filetype}`")
 
     @classmethod
-    def guess_strategy(cls, input_files: List[str], degrees=False) -> ReaderABC:
+    def guess_strategy(cls, input_files: List[str], degrees=False, dtype=np.float64) -> ReaderABC:
         """Method to try to guess an appropriate reader strategy, based on file
         structures and file names.
 
@@ -93,6 +99,10 @@ class EnsembleReader:
         -----------
             *input_files : str
                 One or more files to be read.
+            degrees : bool
+                Sets if read data should be converted from degrees to radians.
+            dtype : np.dtype
+                Floating point type in which the dihedrals are stored.
 
         Returns:
         --------
@@ -106,9 +116,9 @@ class EnsembleReader:
         """
         # Check for the internal CSV-format
         for Reader in cls.STRATEGIES.values():
-            reader = Reader(degrees=degrees)
-            if reader.checkFileFormat(*input_files):
-                return reader
+            # Checked on the class, so no reader is created for failing formats
+            if Reader._checkFileFormat(*input_files, degrees=degrees):
+                return Reader(degrees=degrees, dtype=dtype)
         else:
             # IF all checks fail, raise an UnknownFileStructureError
             raise UnknownFileStructureError("Dihedral input corresponds to no known input format.")
\ No newline at end of file
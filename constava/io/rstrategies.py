@@ -1,10 +1,22 @@
-import abc, os, re
+import abc, os, string
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Optional, Tuple
 from warnings import warn
 import numpy as np
 import pandas as pd
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+except ImportError: # pyarrow is optional, pandas is used as a fallback
+    pa = pacsv = None
+try:
+    from numba import njit
+except ImportError: # numba is optional, pandas is used as a fallback
+    njit = None
 
 from ..utils.ensembles import ProteinEnsemble, ResidueEnsemble
-from ..utils.utils import check_dihedral_range
+from ..utils.utils import check_dihedral_range, degrees_to_radians
 
 
 class UnknownFileStructureError(ValueError):
@@ -12,17 +24,137 @@ class UnknownFileStructureError(ValueError):
     pass
 
 
+if njit is not None:
+    # Exactly representable powers of ten used to convert parsed decimals
+    _POW10 = np.array([float(10**k) for k in range(23)])
+
+    @njit(cache=True)
+    def _parse_xvg_buffer(buf, out):
+        """Parses the raw bytes of a xvg file with two columns of decimals into
+        `out`. Lines starting with `#` or `@` are skipped. Returns the number of
+        parsed rows, or -1 if the file contains anything that cannot be parsed
+        exactly (other column counts, >15 significant digits, large exponents).
+        Numbers are converted by scaling the integer mantissa with an exact
+        power of ten, which is correctly rounded in this range."""
+        n = buf.shape[0]
+        i = 0
+        row = 0
+        while i < n:
+            if buf[i] == 35 or buf[i] == 64: # '#' or '@'
+                while i < n and buf[i] != 10:
+                    i += 1
+                i += 1
+                continue
+            col = 0
+            while i < n and buf[i] != 10:
+                c = buf[i]
+                if c == 32 or c == 9 or c == 13: # whitespace
+                    i += 1
+                    continue
+                if col >= 2:
+                    return -1
+                negative = False
+                if c == 45 or c == 43: # sign
+                    negative = c == 45
+                    i += 1
+                mantissa, ndigits, nfrac = 0, 0, 0
+                while i < n and 48 <= buf[i] <= 57:
+                    mantissa = 10 * mantissa + (buf[i] - 48)
+                    ndigits += 1
+                    i += 1
+                if i < n and buf[i] == 46: # decimal point
+                    i += 1
+                    while i < n and 48 <= buf[i] <= 57:
+                        mantissa = 10 * mantissa + (buf[i] - 48)
+                        ndigits += 1
+                        nfrac += 1
+                        i += 1
+                exponent = 0
+                if i < n and (buf[i] == 101 or buf[i] == 69): # 'e' or 'E'
+                    i += 1
+                    negexp = False
+                    if i < n and (buf[i] == 45 or buf[i] == 43):
+                        negexp = buf[i] == 45
+                        i += 1
+                    nexp = 0
+                    while i < n and 48 <= buf[i] <= 57:
+                        exponent = 10 * exponent + (buf[i] - 48)
+                        nexp += 1
+                        i += 1
+                    if nexp == 0 or nexp > 3:
+                        return -1
+                    if negexp:
+                        exponent = -exponent
+                if ndigits == 0 or ndigits > 15:
+                    return -1
+                if i < n and not (buf[i] == 32 or buf[i] == 9 or buf[i] == 13 or buf[i] == 10):
+                    return -1
+                exponent -= nfrac
+                if exponent < -22 or exponent > 22:
+                    return -1
+                if exponent < 0:
+                    value = mantissa / _POW10[-exponent]
+                else:
+                    value = mantissa * _POW10[exponent]
+                out[row, col] = -value if negative else value
+                col += 1
+            if col == 2:
+                row += 1
+            elif col != 0:
+                return -1
+            i += 1
+        return row
+
+
+def _io_workers(n_files: int) -> int:
+    """Returns the number of threads used to read `n_files` files. Reading is
+    partly I/O-bound, so this may exceed the number of CPUs (same bound as 
+    the default of ThreadPoolExecutor), but never the number of files."""
+    return max(1, min(32, (os.cpu_count() or 1) + 4, n_files))
+
+
+def _peek_first_line(path: str) -> str:
+    """Returns the first line of a file without opening a buffered text 
+    stream. Results are cached per path and modification time, so repeated
+    format checks do not re-read the file."""
+    stat = os.stat(path)
+    return _read_first_line(path, stat.st_mtime_ns, stat.st_size)
+
+@lru_cache(maxsize=1024)
+def _read_first_line(path: str, mtime_ns: int, size: int) -> str:
+    """Reads the first line of a file using raw file descriptor reads"""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        head = b""
+        while b"\n" not in head:
+            chunk = os.read(fd, 256)
+            if not chunk:
+                break
+            head += chunk
+    finally:
+        os.close(fd)
+    return head.split(b"\n", 1)[0].decode("utf-8", errors="replace")
+
+
 class ReaderABC(metaclass=abc.ABCMeta):
     """Base class for all file reader strategies"""
 
-    def __init__(self, degrees: bool = False):
+    def __init__(self, degrees: bool = False, dtype: np.dtype = np.float64):
         self.degrees = degrees
+        self.dtype = dtype
 
     @abc.abstractmethod
     def checkFileFormat(self, *input_files: str) -> bool:
         """Checks if the files provided adhere to the given format."""
         pass
 
+    @classmethod
+    @abc.abstractmethod
+    def _checkFileFormat(cls, *input_files: str, degrees: bool = False) -> bool:
+        """Checks if the files provided adhere to the given format, without 
+        creating a reader (e.g., to guess the reader strategy)."""
+        pass
+
     @abc.abstractmethod
     def readFiles(self, *input_files: str) -> ProteinEnsemble:
         """Reads the dihedral angles from one or more input files, converts them
@@ -31,6 +163,28 @@ class ReaderABC(metaclass=abc.ABCMeta):
         """
         pass
 
+    def _buildEnsemble(self, restypes, respos, phipsi_list) -> ProteinEnsemble:
+        """Converts the per-residue phi/psi arrays into radians (if degrees == 
+        True), checks their range and returns them as a ProteinEnsemble. If all 
+        residues have the same number of frames, the arrays are stacked into 
+        one contiguous Array[R,N,2], so conversion and checks run only once."""
+        if phipsi_list and len({arr.shape for arr in phipsi_list}) == 1:
+            phipsi = self._prepareDihedrals(np.stack(phipsi_list))
+            return ProteinEnsemble.from_arrays(restypes, respos, phipsi)
+        residue_list = [
+            ResidueEnsemble(restype=restype, respos=pos, phipsi=self._prepareDihedrals(phipsi))
+            for restype, pos, phipsi in zip(restypes, respos, phipsi_list)
+        ]
+        return ProteinEnsemble(residue_list)
+
+    def _prepareDihedrals(self, phipsi: np.ndarray) -> np.ndarray:
+        """Converts dihedrals into radians (if degrees == True), checks 
+        their range and casts them to the storage dtype of the reader."""
+        if self.degrees:
+            phipsi = degrees_to_radians(phipsi)
+        check_dihedral_range(phipsi) # Throws errors/warnings if data is not in radians
+        return phipsi.astype(self.dtype, copy=False)
+
 
 class DihedralCsvReader(ReaderABC):
     """A reader strategy for csv files, as provided by constava.dihedrals.
@@ -39,6 +193,10 @@ class DihedralCsvReader(ReaderABC):
     -----------
         degrees : bool
             Sets if read data should be converted from degrees to radians.
+        dtype : np.dtype
+            Floating point type in which the dihedrals are stored (default: 
+            float64). float32 halves the memory of large ensembles, but the 
+            results are no longer bit-identical.
 
     Methods:
     --------
@@ -61,13 +219,17 @@ class DihedralCsvReader(ReaderABC):
             check_ok : bool
                 True if all provided files adhere to the file format, else False.
         """
-        phicol = "Phi[{0}]".format("deg" if self.degrees else "rad")
-        psicol = "Psi[{0}]".format("deg" if self.degrees else "rad")
+        return self._checkFileFormat(*input_files, degrees=self.degrees)
+
+    @classmethod
+    def _checkFileFormat(cls, *input_files: str, degrees: bool = False) -> bool:
+        """Checks the format of the files, with the dihedrals expected in 
+        degrees if `degrees` is True (see `checkFileFormat`)"""
+        phicol = "Phi[{0}]".format("deg" if degrees else "rad")
+        psicol = "Psi[{0}]".format("deg" if degrees else "rad")
         expected_columns = {"#Frame", "ResIndex", "ResName", phicol, psicol}
         for infile in input_files:
-            with open(infile, "r") as f:
-                first_line = f.readline()
-            columns = set(first_line.strip().split(","))
+            columns = set(_peek_first_line(infile).strip().split(","))
             if expected_columns.intersection(columns) != expected_columns:
                 return False
         return True
@@ -89,19 +251,35 @@ class DihedralCsvReader(ReaderABC):
         """
         phicol = "Phi[{0}]".format("deg" if self.degrees else "rad")
         psicol = "Psi[{0}]".format("deg" if self.degrees else "rad")
-        data = pd.DataFrame()
-        for infile in input_files:
-            data = pd.concat([data, pd.read_csv(infile)], axis=0)
-        unique_residues = data[["ResIndex", "ResName"]].drop_duplicates(inplace=False)
-        residue_list = []
-        for i, (resid, resname) in unique_residues.iterrows():
-            phipsi = data.loc[(data["ResIndex"] == resid) & (data["ResName"] == resname), [phicol, psicol]].to_numpy()
-            if self.degrees:
-                phipsi = np.radians(phipsi)
-            check_dihedral_range(phipsi) # Throws errors/warnings if data is not in radians
-            residue_list.append(
-                ResidueEnsemble(restype=resname, respos=resid, phipsi=phipsi))
-        return ProteinEnsemble(residue_list)
+        data = self._readCsvTables(input_files, phicol, psicol)
+        restypes, respos, phipsi_list = [], [], []
+        for (resid, resname), residue_data in data.groupby(["ResIndex", "ResName"], sort=False, observed=True):
+            restypes.append(str(resname))
+            respos.append(int(resid))
+            phipsi_list.append(np.column_stack((
+                residue_data[phicol].to_numpy(dtype=np.float64, copy=False),
+                residue_data[psicol].to_numpy(dtype=np.float64, copy=False))))
+        return self._buildEnsemble(restypes, respos, phipsi_list)
+
+    @staticmethod
+    def _readCsvTables(input_files, phicol: str, psicol: str) -> pd.DataFrame:
+        """Reads and concatenates the CSV files into a single DataFrame. If 
+        available, pyarrow's multithreaded CSV parser is used."""
+        if pacsv is None:
+            dtypes = {"ResIndex": np.int32, "ResName": "category"}
+            with ThreadPoolExecutor(max_workers=_io_workers(len(input_files))) as executor:
+                frames = list(executor.map(
+                    lambda infile: pd.read_csv(infile, dtype=dtypes), 
+                    input_files))
+            return pd.concat(frames, axis=0, ignore_index=True)
+        convert_options = pacsv.ConvertOptions(column_types={
+            "ResIndex": pa.int32(), "ResName": pa.dictionary(pa.int32(), pa.string()), 
+            phicol: pa.float64(), psicol: pa.float64()})
+        with ThreadPoolExecutor(max_workers=_io_workers(len(input_files))) as executor:
+            tables = list(executor.map(
+                lambda infile: pacsv.read_csv(infile, convert_options=convert_options), 
+                input_files))
+        return pa.concat_tables(tables).to_pandas()
 
 
 class GmxChiReader(ReaderABC):
@@ -112,10 +290,16 @@ class GmxChiReader(ReaderABC):
 
     Attributes:
     -----------
-        FILENAME_REGEX : re.Pattern
-            Regular expression to extract RESNAME and RESINDEX from the filename.
+        FILENAME_PREFIX : str
+            Prefix of the filenames, followed by RESNAME and RESINDEX.
+        FILENAME_SUFFIX : str
+            Suffix (file extension) of the filenames.
         degrees : bool
             Sets if read data should be converted from degrees to radians.
+        dtype : np.dtype
+            Floating point type in which the dihedrals are stored (default: 
+            float64). float32 halves the memory of large ensembles, but the 
+            results are no longer bit-identical.
     
     Methods:
     --------
@@ -124,7 +308,10 @@ class GmxChiReader(ReaderABC):
         readFiles(*input_files)
             Reads the dihedral angles from one or more input files.
     """
-    FILENAME_REGEX = re.compile("ramaPhiPsi([A-Z][A-Z0-9][A-Z0-9])([0-9]+).xvg")
+    FILENAME_PREFIX = "ramaPhiPsi"
+    FILENAME_SUFFIX = ".xvg"
+    _RESNAME_FIRST = frozenset(string.ascii_uppercase)
+    _RESNAME_OTHER = frozenset(string.ascii_uppercase + string.digits)
 
     @classmethod
     def checkFileFormat(cls, *input_files: str) -> bool:
@@ -140,10 +327,63 @@ class GmxChiReader(ReaderABC):
             check_ok : bool
                 True if all provided files adhere to the file format, else False.
         """
-        for filename in (os.path.basename(fp) for fp in input_files):
-            if not cls.FILENAME_REGEX.match(filename):
-                return False
-        return True
+        split = cls._splitFilename
+        return all(split(os.path.basename(fp)) is not None for fp in input_files)
+
+    @classmethod
+    def _checkFileFormat(cls, *input_files: str, degrees: bool = False) -> bool:
+        """Checks the format of the files (see `checkFileFormat`). `degrees` 
+        is not used, as the format is identified by the filenames."""
+        return cls.checkFileFormat(*input_files)
+
+    @classmethod
+    def _splitFilename(cls, filename: str) -> Optional[Tuple[str, int]]:
+        """Splits a filename of the form `ramaPhiPsi[RESNAME][RESINDEX].xvg`, 
+        where RESNAME is an uppercase letter followed by two uppercase letters 
+        or digits. Returns (RESNAME, RESINDEX), or None if the filename does 
+        not match."""
+        if not (filename.startswith(cls.FILENAME_PREFIX) and filename.endswith(cls.FILENAME_SUFFIX)):
+            return None
+        stem = filename[len(cls.FILENAME_PREFIX):-len(cls.FILENAME_SUFFIX)]
+        restype, respos = stem[:3], stem[3:]
+        if not (len(restype) == 3 and respos.isascii() and respos.isdigit()
+                and restype[0] in cls._RESNAME_FIRST
+                and restype[1] in cls._RESNAME_OTHER
+                and restype[2] in cls._RESNAME_OTHER):
+            return None
+        return restype, int(respos)
+
+    @classmethod
+    def _parseFilename(cls, infile: str) -> Tuple[str, int]:
+        """Extracts RESNAME and RESINDEX from the filename of a `gmx chi` output."""
+        filename = os.path.basename(infile)
+        parsed = cls._splitFilename(filename)
+        if parsed is None:
+            raise UnknownFileStructureError((
+                f"File does not match the structure of `gmx chi` outputs: {filename}"))
+        return parsed
+
+    @staticmethod
+    def _readXvg(infile: str) -> np.ndarray:
+        """Reads the (phi, psi) columns from a xvg file. Header lines (starting
+        with `#` or `@`) are skipped. If numba is available, the file is 
+        parsed by a compiled parser, else using pandas' C parser."""
+        if njit is not None and os.path.getsize(infile) > 0:
+            buf = np.memmap(infile, dtype=np.uint8, mode="r")
+            out = np.empty((np.count_nonzero(buf == 10) + 1, 2))
+            n_rows = _parse_xvg_buffer(buf, out)
+            del buf
+            if n_rows >= 0:
+                return out[:n_rows]
+        n_header = 0
+        with open(infile, "rb") as fhandle:
+            for line in fhandle:
+                if not line.startswith((b"#", b"@")):
+                    break
+                n_header += 1
+        data = pd.read_csv(infile, sep=r"\s+", header=None, skiprows=n_header, 
+                           engine="c", dtype=np.float64)
+        return data.to_numpy()
     
     def readFiles(self, *input_files) -> ProteinEnsemble:
         """Reads the dihedral angles from one or more input files, converts them
@@ -160,19 +400,14 @@ class GmxChiReader(ReaderABC):
             prot : ProteinEnsemble
                 Object that stores the dihedral angles for all the residues.
         """
-        residue_list = []
-        for infile in input_files:
-            filename = os.path.basename(infile)
-            m = self.FILENAME_REGEX.match(filename)
-            if m is None:
-                raise UnknownFileStructureError((
-                    f"File does not match the structure of `gmx chi` outputs: {filename}"))
-            restype = m.group(1)
-            respos = int(m.group(2))
-            phipsi = np.loadtxt(infile, comments=["#", "@"])
-            if self.degrees:
-                phipsi = np.radians(phipsi)
-            check_dihedral_range(phipsi) # Throws errors/warnings if data is not in radians
-            residue_list.append(
-                ResidueEnsemble(restype=restype, respos=respos, phipsi=phipsi))
-        return ProteinEnsemble(residue_list)
\ No newline at end of file
+        # Files are independent, so they are parsed in a thread pool
+        with ThreadPoolExecutor(max_workers=_io_workers(len(input_files))) as executor:
+            residue_data = list(executor.map(self._readResidue, input_files))
+        restypes, respos, phipsi_list = zip(*residue_data) if residue_data else ((), (), ())
+        return self._buildEnsemble(restypes, respos, list(phipsi_list))
+
+    def _readResidue(self, infile: str) -> Tuple[str, int, np.ndarray]:
+        """Reads the residue name, index and dihedral angles of a single 
+        residue from a xvg file."""
+        restype, respos = self._parseFilename(infile)
+        return restype, respos, self._readXvg(infile)
\ No newline at end of file
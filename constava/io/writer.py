@@ -1,18 +1,27 @@
 """constava.writer contains classes the write the output to different 
 data formats."""
 
+import io
 import os 
+from functools import lru_cache
 from typing import Any
-from .wstrategies import JsonWriter, CsvWriter, TsvWriter
+from .wstrategies import JsonWriter, CsvWriter, TsvWriter, ParquetWriter
 from ..utils.results import ConstavaResults
 
 
+@lru_cache(maxsize=16)
+def _make_strategy(Strategy: type, float_precision: int):
+    """Returns a (cached) writer strategy for the given class and precision"""
+    return Strategy(float_precision)
+
+
 class ResultsWriter:
 
     STRATEGIES = {
         "json": JsonWriter,
         "csv": CsvWriter,
         "tsv": TsvWriter,
+        "parquet": ParquetWriter,
     }
 
     def __init__(self, filename: str, format: str = "auto", float_precision: int = 4):
@@ -24,19 +33,47 @@ class ResultsWriter:
     def __setattr__(self, __name: str, __value: Any) -> None:
         super().__setattr__(__name, __value)
         # Update the strategy
-        if __name in ("filename", "format", "float_precision") and hasattr(self, "_strategy"):
-            super().__setattr__(self._strategy, self.get_strategy())
+        if __name in ("filename", "format", "float_precision") and "_strategy" in self.__dict__:
+            super().__setattr__("_strategy", self.get_strategy())
         
     def get_strategy(self):
         if (self.format or "").lower() in ["auto", "guess", ""]:
-            __fmt = os.path.splitext(self.filename)[1].lstrip(".")
+            __fname = self.filename if self._is_path(self.filename) else getattr(self.filename, "name", "")
+            __fmt = os.path.splitext(os.fspath(__fname))[1].lstrip(".")
         else:
             __fmt = self.format
         if __fmt in self.STRATEGIES:
-            return self.STRATEGIES[__fmt](self.float_precision)
+            return _make_strategy(self.STRATEGIES[__fmt], self.float_precision)
         else:
             raise ValueError(f"Unknown output file format: `{__fmt}`")
 
+    @staticmethod
+    def _is_path(filename) -> bool:
+        """Whether the output is given as a path, rather than a file-like object"""
+        return isinstance(filename, (str, os.PathLike))
+
     def write_results(self, results: ConstavaResults):
-        with open(self.filename, "w") as fhandle:
-            self._strategy.write_results(fhandle, results)
\ No newline at end of file
+        if not self._is_path(self.filename):
+            self._write_to_buffer(self.filename, results)
+            return
+        if self._strategy.binary:
+            with open(self.filename, "wb", buffering=1<<20) as fhandle:
+                self._strategy.write_results(fhandle, results)
+            return
+        # Large buffer to reduce syscalls; no newline translation (csv module
+        # writes its own line terminators)
+        with open(self.filename, "w", encoding="utf-8", buffering=1<<20, newline="") as fhandle:
+            self._strategy.write_results(fhandle, results)
+
+    def _write_to_buffer(self, buffer, results: ConstavaResults):
+        """Writes the results to an open file-like object (e.g., io.BytesIO). 
+        Text formats are encoded as UTF-8 when written to a binary buffer."""
+        if self._strategy.binary or isinstance(buffer, io.TextIOBase):
+            self._strategy.write_results(buffer, results)
+            return
+        fhandle = io.TextIOWrapper(buffer, encoding="utf-8", newline="")
+        try:
+            self._strategy.write_results(fhandle, results)
+            fhandle.flush()
+        finally:
+            fhandle.detach() # Keep the buffer open for the caller
@@ -1,17 +1,33 @@
 import abc
 import csv
+import io
 import json
 from datetime import datetime
-from typing import List, TextIO 
+from typing import BinaryIO, List, TextIO 
 import numpy as np
+try:
+    import orjson
+except ImportError: # orjson is optional, the json module is used as a fallback
+    orjson = None
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError: # pyarrow is optional, only needed to write parquet files
+    pa = pq = None
 from ..utils.constants import CONSTAVA_NAME, CONSTAVA_VERSION
 from ..utils.results import ConstavaResults, ConstavaResultsEntry
 
 
 class WriterABC(metaclass=abc.ABCMeta):
     """Abstract base class for file writers"""
+
+    # Set `True` for strategies that write to files opened in binary mode
+    binary = False
+
     def __init__(self, float_precision: int = 4):
         self.float_precision = float_precision
+        # printf-style format of floats, specialized once for the precision
+        self._flt_fmt = f"%.{float_precision:d}f"
 
     @abc.abstractmethod
     def write_results(self, fhandle: TextIO, results: List[ConstavaResults]):
@@ -32,15 +48,38 @@ class JsonWriter(WriterABC):
             }
         }
         for result in results:
-            cspropensites = np.round(np.stack([entry.state_propensities for entry in result.entries]), decimals=self.float_precision)
-            csvariability = np.round(np.stack([entry.state_variability for entry in result.entries]), decimals=self.float_precision)
-            __dict["results"][result.method] = {
-                state_label: cspropensites[:,i].tolist() 
-                for i, state_label in enumerate(result.state_labels)
-            }
-            __dict["results"][result.method]["Variability"] = csvariability.tolist()
+            cspropensites = self._collect(entry.state_propensities for entry in result.entries)
+            csvariability = self._collect(entry.state_variability for entry in result.entries)
+            # Move the state axis first, so each state's column is contiguous
+            __dict["results"][result.method] = dict(zip(
+                result.state_labels, np.ascontiguousarray(np.moveaxis(cspropensites, 1, 0))))
+            __dict["results"][result.method]["Variability"] = csvariability
 
-        json.dump(__dict, fhandle)
+        # Arrays are serialized natively by orjson, or converted to lists on
+        # the fly by the json module. Both give the same, valid JSON: compact
+        # separators and missing values (NaN) as null
+        if orjson is not None:
+            fhandle.write(orjson.dumps(__dict, option=orjson.OPT_SERIALIZE_NUMPY).decode("utf-8"))
+        else:
+            json.dump(__dict, fhandle, default=self._to_list, separators=(",", ":"), allow_nan=False)
+
+    @staticmethod
+    def _to_list(obj):
+        """Converts numpy arrays for the json module, with NaN as None"""
+        if isinstance(obj, np.ndarray):
+            if obj.dtype.kind == "f":
+                return np.where(np.isnan(obj), None, obj).tolist()
+            return obj.tolist()
+        raise TypeError(f"Object of type {obj.__class__.__name__} is not JSON serializable")
+
+    def _collect(self, values) -> np.ndarray:
+        """Collects the values of all entries into one preallocated array, 
+        rounded (in place) to the set float precision"""
+        values = list(values)
+        arr = np.empty((len(values),) + np.shape(values[0]))
+        for i, value in enumerate(values):
+            arr[i] = value
+        return np.round(arr, decimals=self.float_precision, out=arr)
         
         
 class CsvWriter(WriterABC):
@@ -55,25 +94,79 @@ class CsvWriter(WriterABC):
         writer.writerow([
             "#Method", "SeriesIndex", "ResIndex", "ResName", 
             *results[0].state_labels, "Variability"])
-        # Iterate over results (methods) and entries (residues)
+        # Iterate over results (methods) and entries (residues). The numeric 
+        # part of the rows is formatted directly, bypassing the csv module.
         for result in results:
             for entry in result.entries:
-                writer.writerows(self._write_entry(entry, result.method))
+                fhandle.write(self._format_entry(entry, result.method, writer.dialect))
 
-    def _write_entry(self, entry: ConstavaResultsEntry, method: str) -> List:
-        flt2str = lambda x: "{0:.{1:d}f}".format(x, self.float_precision)
-        respos, restype = entry.residue.respos, entry.residue.restype
+    def _format_entry(self, entry: ConstavaResultsEntry, method: str, dialect) -> str:
+        """Formats the rows of a single entry as they would be written by a
+        csv.writer with the given dialect"""
+        sep, eol = dialect.delimiter, dialect.lineterminator
+        method, restype = self._quote(dialect, method, entry.residue.restype)
+        respos = entry.residue.respos
         # If average state propensities are reported, one row is written
         if len(entry.state_propensities.shape) == 1:
             values = np.concatenate([entry.state_propensities, [entry.state_variability]])
-            yield (method, None, respos, restype, *map(flt2str, values))
+            row_fmt = sep.join([method, "", str(respos), restype] + [self._flt_fmt] * len(values))
+            return row_fmt % tuple(values.tolist()) + eol
         # If state propensities are reported as series, multiple rows are written
         else:
             arr = np.concatenate([entry.state_propensities, [entry.state_variability]]).T
-            for i, values in enumerate(arr):
-                yield (method, i, respos, restype, *map(flt2str, values))
+            row_fmt = sep.join([method, "%d", str(respos), restype] + [self._flt_fmt] * arr.shape[1]) + eol
+            return "".join([row_fmt % (i, *values) for i, values in enumerate(arr.tolist())])
+
+    @staticmethod
+    def _quote(dialect, *fields) -> List[str]:
+        """Quotes text fields the way csv.writer does, and escapes them for use
+        in printf-style row formats"""
+        quoted = []
+        for field in fields:
+            buffer = io.StringIO()
+            csv.writer(buffer, dialect).writerow([field])
+            field = buffer.getvalue()[:-len(dialect.lineterminator)] if field else ""
+            quoted.append(field.replace("%", "%%"))
+        return quoted
 
 
 class TsvWriter(CsvWriter):
     """Writer strategy for writing TSV files (based on CsvWriter)"""
-    csvdialect = {"delimiter": "\t"}
\ No newline at end of file
+    csvdialect = {"delimiter": "\t"}
+
+
+class ParquetWriter(WriterABC):
+    """Writer strategy for writing Parquet files (requires pyarrow). The table
+    has the same columns as the CSV output and is built column by column."""
+
+    binary = True
+    compression = "zstd"
+
+    def write_results(self, fhandle: BinaryIO, results: List[ConstavaResults]):
+        if pa is None:
+            raise ImportError("Writing parquet files requires `pyarrow` to be installed")
+        state_labels = results[0].state_labels
+        columns = {label: [] for label in ["#Method", "SeriesIndex", "ResIndex", "ResName", *state_labels, "Variability"]}
+        for result in results:
+            for entry in result.entries:
+                propensities = np.round(entry.state_propensities, decimals=self.float_precision)
+                variability = np.round(entry.state_variability, decimals=self.float_precision)
+                # Average state propensities result in one row, series in multiple
+                n_rows = 1 if propensities.ndim == 1 else propensities.shape[1]
+                columns["#Method"].append(np.full(n_rows, result.method, dtype=object))
+                columns["SeriesIndex"].append(
+                    np.full(n_rows, None, dtype=object) if propensities.ndim == 1 
+                    else np.arange(n_rows))
+                columns["ResIndex"].append(np.full(n_rows, entry.residue.respos))
+                columns["ResName"].append(np.full(n_rows, entry.residue.restype, dtype=object))
+                for label, values in zip(state_labels, np.reshape(propensities, (len(state_labels), n_rows))):
+                    columns[label].append(values)
+                columns["Variability"].append(np.reshape(variability, n_rows))
+        column_types = {
+            "#Method": pa.string(), "SeriesIndex": pa.int64(), 
+            "ResIndex": pa.int64(), "ResName": pa.string()}
+        table = pa.table({
+            label: pa.array(np.concatenate(arrays), type=column_types.get(label, pa.float64()))
+            for label, arrays in columns.items()
+        })
+        pq.write_table(table, fhandle, compression=self.compression)
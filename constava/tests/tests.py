@@ -1,41 +1,115 @@
 """module for unit testing constava"""
-import os, glob, filecmp
+import os, sys, glob, io, json
+import hashlib
+import pickle
+import shutil
+import subprocess
 import tarfile
 import tempfile
 import unittest
+from unittest import mock
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
 from constava import Constava
+from constava.io import EnsembleReader, ResultsWriter, wstrategies
 from constava.utils.constants import CONSTAVA_DATA_DIR
 from constava.calc.csmodels import ConfStateModelLoadingError, ConfStateModelKDE, ConfStateModelGrid
-from constava.utils.logging import logging
+from constava.utils.logging import logging, configure_logging
+from constava.utils.ensembles import ProteinEnsemble, ResidueEnsemble
+from constava.utils.results import ConstavaResults, ConstavaResultsEntry
+from constava.wrapper import clear_csmodel_cache
 
 logger = logging.getLogger("Constava")
 
+# Set CONSTAVA_FAST_TESTS=1 for quick local runs: the refitted grid model is
+# fitted on a coarse grid, and tests depending on its exact results are skipped
+FAST_TESTS = bool(os.environ.get("CONSTAVA_FAST_TESTS"))
+
+
+def extract_testdata(source: str) -> str:
+    """Extracts the test data into a shared directory, once per version of the
+    tarball, and returns the path of that directory. Later runs and parallel
+    test workers reuse the extracted files."""
+    with open(source, "rb") as fhandle:
+        digest = hashlib.sha256(fhandle.read()).hexdigest()[:12]
+    target = os.path.join(tempfile.gettempdir(), f"constava_testdata_{digest}")
+    if os.path.isfile(os.path.join(target, ".done")):
+        return target
+    # Extract into a private directory first and move it into place, so that
+    # no worker ever sees a partially extracted directory
+    logger.warning(f"TEST PREPARATION: Untarring test data in: {target}")
+    staging = tempfile.mkdtemp(prefix=f"constava_testdata_{digest}.")
+    pigz = shutil.which("pigz")
+    if pigz is not None:
+        # pigz inflates in a separate process, and the tarball is streamed
+        # through a pipe, so decompression and extraction overlap
+        with subprocess.Popen([pigz, "-dc", source], stdout=subprocess.PIPE) as proc:
+            with tarfile.open(fileobj=proc.stdout, mode="r|") as tarchive:
+                tarchive.extractall(staging)
+        if proc.returncode != 0:
+            raise subprocess.CalledProcessError(proc.returncode, proc.args)
+    else:
+        with tarfile.open(source, mode="r|gz") as tarchive:
+            tarchive.extractall(staging)
+    open(os.path.join(staging, ".done"), "w").close()
+    if os.path.isdir(target) and not os.path.isfile(os.path.join(target, ".done")):
+        shutil.rmtree(target, ignore_errors=True) # Leftovers of an interrupted run
+    try:
+        os.rename(staging, target)
+    except OSError: # Another worker was faster
+        shutil.rmtree(staging, ignore_errors=True)
+    return target
+
 
 class TestWrapper(unittest.TestCase):
-    """Class that runs test runs on the wrapper as a whole"""
+    """Base class for test runs on the wrapper as a whole, providing the test
+    data and temporary files. Each subclass runs in its own temporary
+    directory."""
 
     TEST_SOURCE = os.path.join(CONSTAVA_DATA_DIR, "constava_testdata.tgz")
     TEST_TEMPORARY_DIRECTORY = None
     TEST_TEMPDIR = None
+    TEST_DATADIR = None
     TEST_MODELDUMP0 = None
     TEST_MODELDUMP1 = None
+    TEST_CACHEDIR = None
+    TEST_EXPECTED = {}
+    _cva_cache = {}
 
     @classmethod
     def setUpClass(cls):
         """Setup method that generates a temporary directory and some file paths
-        that are used by all tests"""
+        that are used by all tests, and provides the extracted test data"""
         if cls.TEST_TEMPORARY_DIRECTORY is None:
             # Create the temporary directory and files for tests
             cls.TEST_TEMPORARY_DIRECTORY = tempfile.TemporaryDirectory(prefix="ConstavaTest.")
             cls.TEST_TEMPDIR = cls.TEST_TEMPORARY_DIRECTORY.name
             _, cls.TEST_MODELDUMP0 = tempfile.mkstemp(prefix="model.", suffix=".pkl", dir=cls.TEST_TEMPDIR)
             _, cls.TEST_MODELDUMP1 = tempfile.mkstemp(prefix="model.", suffix=".pkl", dir=cls.TEST_TEMPDIR)
+            # Fitted models are cached in an empty directory, so they are 
+            # always fitted first and then reloaded from this cache
+            cls.TEST_CACHEDIR = os.path.join(cls.TEST_TEMPDIR, "cache")
             logger.warning(f"TEST PREPARATION: Creating temporary directory: {cls.TEST_TEMPDIR}")
 
-            # Extract the test files into the new temporary directory
-            logger.warning(f"TEST PREPARATION: Untarring test data in: {cls.TEST_TEMPDIR}")
-            with tarfile.open(cls.TEST_SOURCE, mode="r:gz") as tarchive:
-                tarchive.extractall(cls.TEST_TEMPDIR)
+            # The test files are extracted once and shared between test runs
+            cls.TEST_DATADIR = extract_testdata(cls.TEST_SOURCE)
+            # Read the expected results once
+            for expected_result in ("xvg/result_kde.csv", "csv/result_grid.csv"):
+                with open(os.path.join(cls.TEST_DATADIR, expected_result), "rb") as fhandle:
+                    cls.TEST_EXPECTED[expected_result] = fhandle.read()
+
+    @classmethod
+    def _get_cva(cls, model_load: str, **kwargs) -> Constava:
+        """Returns a Constava object with the given model loaded. Objects from 
+        the loading tests are reused, so the model is not unpickled again."""
+        cva = cls._cva_cache.get(model_load)
+        if cva is None:
+            cva = cls._cva_cache[model_load] = Constava(model_load=model_load, **kwargs)
+        else:
+            for parameter, value in kwargs.items():
+                cva.set_param(parameter, value)
+        return cva
 
     @classmethod
     def get_test_count(cls):
@@ -45,18 +119,37 @@ class TestWrapper(unittest.TestCase):
             cls.TEST_COUNTER += 1
             print()
         return cls.TEST_COUNTER
-    
+
+
+class KDETestCase(TestWrapper):
+    """Tests fitting, loading and inference of the 'kde' model"""
+
     def test_0a_KDEModelFitting(self):
         """Test fitting of a KDE model, dumps model for further tests"""
         logger.warning(f"TEST #{self.get_test_count()}: Fitting of 'kde' model...")
+        clear_csmodel_cache()
         cva = Constava(verbose=0)
-        csmodel = cva.fit_csmodel(kde_bandwidth=.1291)
+        csmodel = cva.fit_csmodel(kde_bandwidth=.1291, cache_dir=self.TEST_CACHEDIR)
         self.assertIsInstance(csmodel, ConfStateModelKDE, "Failed to fit conformational state model.")
+        self.assertEqual(len(glob.glob(os.path.join(self.TEST_CACHEDIR, "*.pkl"))), 1, 
+                         "Failed to cache fitted conformational state model on disk.")
 
         logger.warning(f"TEST #{self.get_test_count()}: Caching of 'kde' model...")
-        cva.fit_csmodel(kde_bandwidth=.1291)
+        cva.fit_csmodel(kde_bandwidth=.1291, cache_dir=self.TEST_CACHEDIR)
         self.assertIs(csmodel, cva._csmodel, "Failed to reuse preloaded conformational state model.")
 
+        logger.warning(f"TEST #{self.get_test_count()}: Reusing 'kde' model in a new session...")
+        # Models shared within the process are dropped, so the model is 
+        # loaded from the on-disk model cache
+        clear_csmodel_cache()
+        csmodel2 = Constava(verbose=0).fit_csmodel(kde_bandwidth=.1291, cache_dir=self.TEST_CACHEDIR)
+        self.assertIsInstance(csmodel2, ConfStateModelKDE, "Failed to reuse conformational state model.")
+        self.assertIsNot(csmodel, csmodel2, "Failed to load conformational state model from the cache.")
+        self.assertEqual(csmodel.get_labels(), csmodel2.get_labels(), "Reused conformational state model differs.")
+        phipsi = np.linspace(-np.pi, np.pi, 20).reshape(10, 2)
+        np.testing.assert_array_equal(csmodel.get_logpdf(phipsi), csmodel2.get_logpdf(phipsi), 
+                                      "Reused conformational state model differs.")
+
         logger.warning(f"TEST #{self.get_test_count()}: Fitting a new 'kde' model...")
         cva.fit_csmodel(kde_bandwidth=.1)
         self.assertIsNot(csmodel, cva._csmodel, "Failed to update conformational state model after parameter change.")
@@ -65,23 +158,28 @@ class TestWrapper(unittest.TestCase):
         logger.warning(f"... Dumping model in: {self.TEST_MODELDUMP0}")
         cva._csmodel.dump_pickle(self.TEST_MODELDUMP0)
         self.assertTrue(os.path.isfile(self.TEST_MODELDUMP0), "Failed to conformational state dump model.")
+        with open(self.TEST_MODELDUMP0, "rb") as fhandle:
+            self.assertEqual(fhandle.read(2), pickle.PROTO + bytes([pickle.HIGHEST_PROTOCOL]), 
+                             "Model not pickled with the highest protocol.")
 
     def test_1a_KDEModelLoading(self):
         """Test loading of pre-fitted KDE model"""
         logger.warning(f"TEST #{self.get_test_count()}: Loading of pickled 'kde' models...")
         cva = Constava(verbose=0, model_load=self.TEST_MODELDUMP0)
         cva.load_csmodel(pickled_csmodel=self.TEST_MODELDUMP0)
+        self._cva_cache[self.TEST_MODELDUMP0] = cva
         self.assertIsInstance(cva._csmodel, ConfStateModelKDE, "Failed to fit conformational state model.")
 
     def test_2a_KDEModelInference(self):
         """Test inference from pre-fitted KDE model"""
         logger.warning(f"TEST #{self.get_test_count()}: Inference from 'kde' conformational state model...")
-        input_files = glob.glob(f"{self.TEST_TEMPDIR}/xvg/ramaPhiPsi*.xvg")
-        expected_result = f"{self.TEST_TEMPDIR}/xvg/result_kde.csv"
-        output_file  = tempfile.NamedTemporaryFile(prefix="kde.", suffix=".csv", dir=self.TEST_TEMPDIR)
-        cva = Constava(
+        input_files = glob.glob(f"{self.TEST_DATADIR}/xvg/ramaPhiPsi*.xvg")
+        expected_result = self.TEST_EXPECTED["xvg/result_kde.csv"]
+        output_file = io.BytesIO()
+        cva = self._get_cva(
             input_files = input_files,
-            output_file = output_file.name,
+            output_file = output_file,
+            output_format = "csv",
             model_type = "kde",
             model_load = self.TEST_MODELDUMP0,
             window = [1,3,7,23], 
@@ -91,7 +189,11 @@ class TestWrapper(unittest.TestCase):
             verbose = 0, 
             input_degrees=True)
         cva.run()
-        self.assertTrue(filecmp.cmp(output_file.name, expected_result))
+        self.assertEqual(output_file.getvalue(), expected_result, "Results differ from the expected results.")
+
+
+class GridTestCase(TestWrapper):
+    """Tests fitting, loading and inference of the 'grid' model"""
 
     def test_0b_GridModelFitting(self):
         """Test fitting of a grid-interpolation model, dumps model for further tests"""
@@ -105,30 +207,36 @@ class TestWrapper(unittest.TestCase):
         self.assertIs(csmodel, cva._csmodel, "Failed to reuse preloaded conformational state model.")
 
         logger.warning(f"TEST #{self.get_test_count()}: Fitting a new 'grid' model...")
-        cva.fit_csmodel(model_type="grid", kde_bandwidth=.1, grid_points=3601)
+        cva.fit_csmodel(model_type="grid", kde_bandwidth=.1, grid_points=(361 if FAST_TESTS else 3601))
         self.assertIsNot(csmodel, cva._csmodel, "Failed to update conformational state model after parameter change.")
 
         logger.warning(f"TEST #{self.get_test_count()}: Storing of pickled 'grid' models...")
         logger.warning(f"... Dumping model in: {self.TEST_MODELDUMP1}")
         cva._csmodel.dump_pickle(self.TEST_MODELDUMP1)
         self.assertTrue(os.path.isfile(self.TEST_MODELDUMP1), "Failed to conformational state dump model.")
+        with open(self.TEST_MODELDUMP1, "rb") as fhandle:
+            self.assertEqual(fhandle.read(2), pickle.PROTO + bytes([pickle.HIGHEST_PROTOCOL]), 
+                             "Model not pickled with the highest protocol.")
 
     def test_1b_GridModelLoading(self):
         """Test loading of pre-fitted grid-inference model"""
         logger.warning(f"TEST #{self.get_test_count()}: Loading of pickled 'grid' models...")
         cva = Constava(verbose=0, model_load=self.TEST_MODELDUMP1)
         cva.load_csmodel(pickled_csmodel=self.TEST_MODELDUMP1)
+        self._cva_cache[self.TEST_MODELDUMP1] = cva
         self.assertIsInstance(cva._csmodel, ConfStateModelGrid, "Failed to fit conformational state model.")
 
+    @unittest.skipIf(FAST_TESTS, "Expected results require the model with 3601 grid points")
     def test_2b_GridModelInference(self):
         """Test inference from pre-fitted grid-inference model"""
         logger.warning(f"TEST #{self.get_test_count()}: Inference from 'grid' conformational state model...")
-        input_files = f"{self.TEST_TEMPDIR}/csv/dihedrals.csv"
-        expected_result = f"{self.TEST_TEMPDIR}/csv/result_grid.csv"
-        output_file  = tempfile.NamedTemporaryFile(prefix="grid.", suffix=".csv", dir=self.TEST_TEMPDIR)
-        c = Constava(
+        input_files = f"{self.TEST_DATADIR}/csv/dihedrals.csv"
+        expected_result = self.TEST_EXPECTED["csv/result_grid.csv"]
+        output_file = io.BytesIO()
+        c = self._get_cva(
             input_files = input_files,
-            output_file = output_file.name,
+            output_file = output_file,
+            output_format = "csv",
             model_type = "grid",
             model_load = self.TEST_MODELDUMP1,
             window = [1,3,7,23], 
@@ -138,20 +246,133 @@ class TestWrapper(unittest.TestCase):
             verbose = 0, 
             input_degrees=False)
         c.run()
-        self.assertTrue(filecmp.cmp(output_file.name, expected_result))
-
-def run_unittest():
-        """Run the unittests in this module"""
-        suite = unittest.TestSuite((
-            TestWrapper("test_0a_KDEModelFitting"),
-            TestWrapper("test_1a_KDEModelLoading"),
-            TestWrapper("test_2a_KDEModelInference"),
-            TestWrapper("test_0b_GridModelFitting"),
-            TestWrapper("test_1b_GridModelLoading"),
-            TestWrapper("test_2b_GridModelInference"),
-        ))
-        runner = unittest.TextTestRunner()
-        runner.run(suite)
+        self.assertEqual(output_file.getvalue(), expected_result, "Results differ from the expected results.")
+
+    def test_3b_GridModelSinglePrecision(self):
+        """Test fitting of a single precision grid-inference model"""
+        logger.warning(f"TEST #{self.get_test_count()}: Fitting of single precision 'grid' models...")
+        cva = Constava(verbose=0)
+        csmodel64 = cva.fit_csmodel(model_type="grid", kde_bandwidth=.42, grid_points=145)
+        csmodel32 = cva.fit_csmodel(model_type="grid", kde_bandwidth=.42, grid_points=145, grid_dtype="float32")
+        self.assertIsNot(csmodel64, csmodel32, "Failed to update conformational state model after parameter change.")
+        self.assertEqual(csmodel32.state_grids.dtype, np.float32, "Failed to fit single precision grid.")
+        data = np.random.default_rng(42).uniform(-np.pi, np.pi, (100, 2))
+        np.testing.assert_allclose(csmodel32.get_logpdf(data), csmodel64.get_logpdf(data), rtol=1e-4, atol=1e-4)
+        with self.assertRaises(ValueError, msg="Failed to reject unknown grid precision."):
+            cva.fit_csmodel(model_type="grid", grid_dtype="float16")
+
+class IOTestCase(TestWrapper):
+    """Tests reading of input files and writing of results"""
+
+    def test_0c_EmptyInput(self):
+        """Test that input files without dihedrals are rejected"""
+        logger.warning(f"TEST #{self.get_test_count()}: Reading a xvg file without dihedrals...")
+        input_file = os.path.join(self.TEST_TEMPDIR, "ramaPhiPsiALA2.xvg")
+        with open(input_file, "w") as fhandle:
+            fhandle.write("# Header only\n@    title \"Ramachandran Plot\"\n")
+        with self.assertRaises(ValueError, msg="Failed to reject input without dihedrals."):
+            EnsembleReader().readFiles(input_file)
+
+    @staticmethod
+    def _get_results() -> ConstavaResults:
+        """Returns results for three residues, with missing values (NaN) for 
+        the second residue"""
+        protein = ProteinEnsemble([
+            ResidueEnsemble("ALA", i, np.zeros((3, 2))) for i in range(1, 4)])
+        results = ConstavaResults(method="window/3/", protein=protein, state_labels=["A", "B"])
+        for i, residue in enumerate(protein.get_residues()):
+            value = np.nan if i == 1 else .25 * i
+            results.add_entry(ConstavaResultsEntry(
+                residue, np.array([value, .5]), value))
+        return results
+
+    @staticmethod
+    def _get_series_results() -> ConstavaResults:
+        """Returns results of a subsampling series (two rows per residue)"""
+        protein = ProteinEnsemble([
+            ResidueEnsemble("GLY", i, np.zeros((3, 2))) for i in range(1, 3)])
+        results = ConstavaResults(method="window-series/3/", protein=protein, state_labels=["A", "B"])
+        for i, residue in enumerate(protein.get_residues()):
+            results.add_entry(ConstavaResultsEntry(
+                residue, np.array([[.123456, .2], [.876544, .8]]) + i / 10, np.array([.1, .2]) * i))
+        return results
+
+    def test_1c_JsonOutput(self):
+        """Test that the JSON output is valid and identical with and without orjson"""
+        logger.warning(f"TEST #{self.get_test_count()}: Writing results as JSON...")
+        outputs = []
+        for orjson in {wstrategies.orjson, None}:
+            output_file = io.BytesIO()
+            with mock.patch.object(wstrategies, "orjson", orjson):
+                ResultsWriter(output_file, format="json").write_results([self._get_results()])
+            data = json.loads(output_file.getvalue(), parse_constant=lambda c: self.fail(f"Invalid JSON constant: {c}"))
+            data.pop("creation_date")
+            outputs.append(data)
+            self.assertEqual(data["results"]["window/3/"]["A"], [0.0, None, 0.5], 
+                             "Missing values not written as null.")
+        self.assertEqual(outputs[0], outputs[-1], "JSON output depends on orjson.")
+
+    @unittest.skipIf(wstrategies.pa is None, "Writing parquet files requires pyarrow")
+    def test_2c_ParquetOutput(self):
+        """Test that the parquet output holds the same table as the CSV output"""
+        logger.warning(f"TEST #{self.get_test_count()}: Writing results as parquet...")
+        results = [self._get_results(), self._get_series_results()]
+        tables = {}
+        for format in ("csv", "parquet"):
+            output_file = io.BytesIO()
+            ResultsWriter(output_file, format=format).write_results(results)
+            output_file.seek(0)
+            tables[format] = (pd.read_csv(output_file) if format == "csv" 
+                              else pd.read_parquet(output_file))
+        pd.testing.assert_frame_equal(tables["parquet"], tables["csv"], check_dtype=False)
+
+    def test_3c_SinglePrecisionInput(self):
+        """Test reading of dihedrals in single precision"""
+        logger.warning(f"TEST #{self.get_test_count()}: Reading dihedrals in single precision...")
+        input_file = f"{self.TEST_DATADIR}/csv/dihedrals.csv"
+        cva = Constava(verbose=0)
+        ensembles = {dtype: cva.initialize_reader(format="csv", dtype=dtype).readFiles(input_file)
+                     for dtype in ("float64", "float32")}
+        for res64, res32 in zip(ensembles["float64"].get_residues(), ensembles["float32"].get_residues()):
+            self.assertEqual(res32.phipsi.dtype, np.float32, "Failed to read dihedrals in single precision.")
+            np.testing.assert_allclose(res32.phipsi, res64.phipsi, rtol=1e-6)
+        with self.assertRaises(ValueError, msg="Failed to reject unknown input precision."):
+            cva.initialize_reader(dtype="float16")
+
+
+# The test cases are independent of each other, while the tests within a case
+# depend on each other (e.g., loading a dumped model) and run in order
+TEST_CASES = (KDETestCase, GridTestCase, IOTestCase)
+
+def _run_test_case(TestCase):
+    """Runs all tests of a test case and returns the runner's output and the
+    number of tests run, failed and errored (TestResults cannot be pickled)"""
+    stream = io.StringIO()
+    suite = unittest.defaultTestLoader.loadTestsFromTestCase(TestCase)
+    result = unittest.TextTestRunner(stream=stream).run(suite)
+    return stream.getvalue(), result.testsRun, len(result.failures), len(result.errors)
+
+def run_unittest(n_workers: int = None):
+        """Run the unittests in this module. With more than one worker, the
+        independent test cases are run in separate processes."""
+        configure_logging()
+        n_workers = min(n_workers or os.cpu_count() or 1, len(TEST_CASES))
+        if n_workers < 2:
+            suite = unittest.TestSuite(
+                unittest.defaultTestLoader.loadTestsFromTestCase(TestCase) 
+                for TestCase in TEST_CASES)
+            runner = unittest.TextTestRunner()
+            return runner.run(suite).wasSuccessful()
+
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            outcomes = list(executor.map(_run_test_case, TEST_CASES))
+        for output, *_ in outcomes:
+            sys.stderr.write(output)
+        n_run, n_failed, n_errors = (sum(counts) for counts in zip(*(o[1:] for o in outcomes)))
+        sys.stderr.write(f"\nRan {n_run} tests in {len(outcomes)} parallel test cases: "
+                         f"{'OK' if n_failed + n_errors == 0 else 'FAILED'} "
+                         f"(failures={n_failed}, errors={n_errors})\n")
+        return n_failed + n_errors == 0
 
 if __name__ == "__main__":
     run_unittest()
\ No newline at end of file
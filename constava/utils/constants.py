@@ -1,5 +1,6 @@
 """constava.constants contains general information for all modules"""
 from importlib.metadata import version
+from types import MappingProxyType
 import os
 
 CONSTAVA_NAME = __name__.split(".")[0]
@@ -7,12 +8,16 @@ CONSTAVA_VERSION = version(CONSTAVA_NAME)
 CONSTAVA_SOURCE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 CONSTAVA_DATA_DIR = os.path.join(CONSTAVA_SOURCE_DIR, "data")
 DEFAULT_TRAINING_DATA_PATH = os.path.join(CONSTAVA_DATA_DIR, "constava_csdata.json")
+# Directory in which fitted models are cached. Caching is opt-in: fitted models
+# are only written to (and unpickled from) disk if CONSTAVA_CACHE_DIR is set
+CONSTAVA_CACHE_DIR = os.environ.get("CONSTAVA_CACHE_DIR") or None
 
-aminoacids1to3 = dict(
+# Read-only mappings between one- and three-letter amino acid codes
+aminoacids1to3 = MappingProxyType(dict(
 	A="ALA", C="CYS", D="ASP", E="GLU", F="PHE",
 	G="GLY", H="HIS", I="ILE", K="LYS", L="LEU",
 	M="MET", N="ASN", P="PRO", Q="GLN", R="ARG",
 	S="SER", T="THR", V="VAL", W="TRP", Y="TYR",
-)
+))
 
-aminoacids3to1 = {j: i for i, j in aminoacids1to3.items()}
+aminoacids3to1 = MappingProxyType({j: i for i, j in aminoacids1to3.items()})
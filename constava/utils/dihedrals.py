@@ -2,13 +2,39 @@
 phi/psi backbone dihedral angles from a conformational ensmeble. """
 
 import argparse, os, sys
-from typing import List, NamedTuple
+from itertools import chain, islice
+from typing import Iterable, Iterator, List, NamedTuple
 
 import MDAnalysis as mda
 from MDAnalysis.analysis.dihedrals import Ramachandran
+from MDAnalysis.lib.distances import calc_dihedrals
 import numpy as np
 import pandas as pd
 
+
+class _Ramachandran(Ramachandran):
+    """Ramachandran analysis that writes the (phi, psi) angles of each frame
+    into one preallocated array. MDAnalysis' implementation builds a list of 
+    per-residue tuples in every frame, which is then copied into an array and
+    again for the conversion to degrees, holding up to three copies at once."""
+
+    def _prepare(self):
+        self.results.angles = np.empty((self.n_frames, len(self.ag1), 2))
+
+    def _single_frame(self):
+        # Positions of the atoms shared by phi and psi are only fetched once
+        pos1, pos2, pos3, pos4, pos5 = (
+            ag.positions for ag in (self.ag1, self.ag2, self.ag3, self.ag4, self.ag5))
+        box = self.ag1.dimensions
+        angles = np.empty((2, len(pos1)))
+        calc_dihedrals(pos1, pos2, pos3, pos4, box=box, result=angles[0])
+        calc_dihedrals(pos2, pos3, pos4, pos5, box=box, result=angles[1])
+        self.results.angles[self._frame_index] = angles.T
+
+    def _conclude(self):
+        np.rad2deg(self.results.angles, out=self.results.angles)
+
+
 def parse_arguments(cmdline_arguments: List[str]) -> NamedTuple:
     """Parses the command line arguments and does some minor sanity checking.
     
@@ -36,6 +62,8 @@ def parse_arguments(cmdline_arguments: List[str]) -> NamedTuple:
         help="(Optional) Defines the number of decimals written for the dihedrals. (default: 5)")
     parser.add_argument("--degrees", action="store_true",
         help="(Optional) Results are written in degrees instead of radians. (default: radians)")
+    parser.add_argument("--processes", default=None, type=int,
+        help="(Optional) Number of processes used to analyze the trajectory. (default: number of CPUs)")
     args = parser.parse_args(cmdline_arguments)
 
     if args.output is None:
@@ -47,7 +75,8 @@ def parse_arguments(cmdline_arguments: List[str]) -> NamedTuple:
                 ))
     return args
 
-def calculate_dihedrals(structure: str, trajectory: List[str], selection: str = "protein", degree: bool = False):
+def calculate_dihedrals(structure: str, trajectory: List[str], selection: str = "protein", degree: bool = False,
+                        n_processes: int = None):
     """Calculates the backbone dihedral angles and returns the result as a 
     DataFrame.
     
@@ -64,6 +93,10 @@ def calculate_dihedrals(structure: str, trajectory: List[str], selection: str =
         degrees : bool
             If True dihedrals are reported in degrees, else in radians. 
             [default: False]
+        n_processes : int
+            Number of processes among which the trajectory frames are split.
+            Requires MDAnalysis>=2.8, older versions analyze the trajectory 
+            serially. [default: number of CPUs]
     
     Returns:
     --------
@@ -71,41 +104,105 @@ def calculate_dihedrals(structure: str, trajectory: List[str], selection: str =
             DataFrame containing the backbone dihedral angles calculated along 
             the trajectory
     """
+    dihedrals, = iterate_dihedrals(structure, trajectory, selection, degree, 
+                                   n_processes, residues_per_block=None)
+    return dihedrals
+
+def iterate_dihedrals(structure: str, trajectory: List[str], selection: str = "protein", degree: bool = False,
+                      n_processes: int = None, residues_per_block: int = 100) -> Iterator[pd.DataFrame]:
+    """Calculates the backbone dihedral angles and yields the result as 
+    DataFrames, each covering a block of residues along the whole trajectory.
+    Only one block is held as a DataFrame at a time.
+    
+    Parameters:
+    -----------
+        structure, trajectory, selection, degrees, n_processes
+            See `calculate_dihedrals`
+        residues_per_block : int
+            Number of residues per DataFrame. If None, a single DataFrame with
+            all residues is yielded. [default: 100]
+    
+    Returns:
+    --------
+        dihedrals : Iterator[DataFrame]
+            DataFrames containing the backbone dihedral angles calculated along 
+            the trajectory, ordered by residue
+    """
     # Load trajectory files
     u = mda.Universe(structure, trajectory)
     # Calculate dihedral angles.
-    rama = Ramachandran(u.select_atoms(selection))
-    rama.run()
+    rama = _Ramachandran(u.select_atoms(selection))
+    n_processes = min(n_processes or os.cpu_count() or 1, len(u.trajectory))
+    if n_processes > 1 and "multiprocessing" in getattr(rama, "get_supported_backends", tuple)():
+        # Frames are independent, so blocks of the trajectory are analyzed in
+        # parallel, each with its own trajectory reader
+        rama.run(backend="multiprocessing", n_workers=n_processes)
+    else:
+        rama.run()
+    results = rama.results.angles
     if degree:
         phicol, psicol = "Phi[deg]", "Psi[deg]"
-        results = rama.results.angles
     else:
         phicol, psicol = "Phi[rad]", "Psi[rad]"
-        results = np.radians(rama.results.angles)
-    # Convert resulting numpy array into a comprehensive DataFrame
-    dihedrals = pd.DataFrame(columns = ["#Frame", "ResIndex", "ResName", phicol, psicol])
-    # Iterate over selection (C-alphas) used to define the dihedrals
-    for i, atom in enumerate(rama.ag3):
-        # Select results for given
-        df = pd.DataFrame({
-            "#Frame": rama.frames,
-            "ResIndex": np.full(rama.frames.shape, atom.resid, dtype=int),
-            "ResName": np.full(rama.frames.shape, atom.resname),
-            phicol: results[:,i,0], 
-            psicol: results[:,i,1]})
-        dihedrals = pd.concat([dihedrals, df], ignore_index=True)
-    return dihedrals
+        # Converted in place, the angles are not used elsewhere
+        np.radians(results, out=results)
+    # Convert resulting numpy array into comprehensive DataFrames. Rows are
+    # ordered by residue (C-alphas used to define the dihedrals), then frame
+    n_frames, n_residues = results.shape[:2]
+    residues_per_block = residues_per_block or max(n_residues, 1)
+    for start in range(0, max(n_residues, 1), residues_per_block):
+        block = slice(start, start + residues_per_block)
+        atoms = rama.ag3[block]
+        categories, codes = np.unique(atoms.resnames, return_inverse=True)
+        yield pd.DataFrame({
+            "#Frame": np.tile(rama.frames, len(atoms)),
+            "ResIndex": np.repeat(atoms.resids.astype(int), n_frames),
+            "ResName": pd.Categorical.from_codes(np.repeat(codes, n_frames), categories),
+            phicol: results[:,block,0].T.ravel(),
+            psicol: results[:,block,1].T.ravel()})
+
+def write_dihedrals(dihedrals: Iterable[pd.DataFrame], output: str, precision: int = 5):
+    """Writes the DataFrames of backbone dihedral angles (e.g., as yielded by 
+    `iterate_dihedrals`) to a single CSV file, one after the other.
+    
+    Parameters:
+    -----------
+        dihedrals : Iterable[DataFrame]
+            DataFrames containing the backbone dihedral angles
+        output : str
+            Path of the CSV file to write to
+        precision : int
+            Number of decimals written for the dihedrals. [default: 5]
+    """
+    float2str = f"%.{precision}f" # Definition of float format in output
+    # Rows are formatted with a single printf-style template, which gives the
+    # same output as pandas' float_format at a fraction of the cost
+    row_fmt = ",".join(["%d", "%d", "%s", float2str, float2str])
+    # The analysis runs when the first block is requested. It is done before
+    # opening the file, so a failing analysis leaves no empty file behind
+    dihedrals = iter(dihedrals)
+    first = next(dihedrals, None)
+    blocks = chain([first], dihedrals) if first is not None else ()
+    with open(output, "w", newline="") as fhandle:
+        for i, df in enumerate(blocks):
+            if i == 0:
+                fhandle.write(",".join(df.columns) + os.linesep)
+            if df.iloc[:,3:].isna().to_numpy().any():
+                # Missing angles are written as empty fields by pandas
+                df.to_csv(fhandle, header=False, index=False, float_format=float2str)
+                continue
+            rows = zip(*(np.asarray(df[col]).tolist() for col in df.columns))
+            for chunk in iter(lambda: list(islice(rows, 100_000)), []):
+                fhandle.write(os.linesep.join([row_fmt % row for row in chunk]) + os.linesep)
 
 def main(cmdline_arguments: List[str]):
     """Main function executed when the script is run from the command line"""
     # Parse command line arguments
     args = parse_arguments(cmdline_arguments)
-    # Calculate dihedrals
-    dihedrals = calculate_dihedrals(
-        args.structure, args.trajectory, args.selection, args.degrees)
-    # Write results
-    float2str = f"%.{args.precision}f" # Definition of float format in output
-    dihedrals.to_csv(args.output, header=True, index=False, float_format=float2str)
+    # Calculate dihedrals and write results, one block of residues at a time
+    dihedrals = iterate_dihedrals(
+        args.structure, args.trajectory, args.selection, args.degrees, args.processes)
+    write_dihedrals(dihedrals, args.output, args.precision)
 
 if __name__ == "__main__":
     sys.exit(main(sys.argv[1:]))
\ No newline at end of file
@@ -2,11 +2,13 @@
 conformational ensemble.
 """
 
-from dataclasses import dataclass
+from bisect import insort
+from dataclasses import dataclass, field
 from typing import List, Generator
 import numpy as np
 
 from .constants import aminoacids3to1
+from .utils import DATACLASS_SLOTS
 
 
 class EnsembleMismatchError(ValueError):
@@ -14,7 +16,7 @@ class EnsembleMismatchError(ValueError):
     pass
 
 
-@dataclass
+@dataclass(**DATACLASS_SLOTS)
 class ResidueEnsemble:
     """ 
     Dataclass to hold information on a given residue in a conformational ensemble:
@@ -32,7 +34,7 @@ class ResidueEnsemble:
     restype: str = ""
     respos: int = None
     phipsi: np.ndarray = None
-    protein = None
+    protein: "ProteinEnsemble" = field(default=None, repr=False, compare=False)
 
     @property
     def restype1(self):
@@ -73,7 +75,28 @@ class ProteinEnsemble:
                                                 to be added to the ensemble. 
         """
         self._residues = []
-        self.add_residues(*residues)
+        self.add_residues(*(residues or []))
+
+    @classmethod
+    def from_arrays(cls, restypes: List[str], respos: List[int], phipsi: np.ndarray):
+        """ Constructs a ProteinEnsemble from a single phi/psi tensor, where all
+        residues have the same number of conformations. The ResidueEnsemble 
+        objects hold views into the shared tensor, so the data is not copied.
+        
+        Parameters:
+        -----------
+            restypes: List[str]     Residue names of the R residues
+            respos: List[int]       Indices of the R residues in the sequence
+            phipsi: array[R,N,2]    Array of the phi/psi angles of all residues
+                                    for all conformations in the ensemble
+        """
+        if len(restypes) != len(respos) or len(respos) != phipsi.shape[0]:
+            raise ValueError("restypes, respos and phipsi must describe the same number of residues")
+        residues = [
+            ResidueEnsemble(restype=restype, respos=pos, phipsi=phipsi[i])
+            for i, (restype, pos) in enumerate(zip(restypes, respos))
+        ]
+        return cls(residues)
 
     def __repr__(self):
         """ Short string representation of a class-object """
@@ -93,23 +116,13 @@ class ProteinEnsemble:
     @property
     def sequence(self):
         """ Returns the protein sequence as a string """
-        seq = self._getPropertyFromResidues("restype1", fillvalue="-")
-        return "".join(seq)
-    
-    def _getPropertyFromResidues(self, resattr: str, *, fillvalue=np.nan, dtype=None):
-        """ Private helper function, to retrieve properties from the individual
-        residues across the whole protein. """
+        # Built from a plain list, rather than a numpy array of one-letter 
+        # strings, with one lookup in the amino acid map per residue
         offset = self._residues[0].respos
-        result = None
-        for i, value in ((res.respos-offset, getattr(res, resattr)) for res in self.get_residues()):
-            if value is None:
-                continue
-            elif result is None and isinstance(value, np.ndarray):
-                result = np.full((self.n_residues,)+value.shape, fillvalue)
-            elif result is None:
-                result = np.full((self.n_residues,), fillvalue)
-            result[i] = value
-        return result
+        seq = ["-"] * self.resrange
+        for res in self._residues:
+            seq[res.respos - offset] = aminoacids3to1.get(res.restype, "X")
+        return "".join(seq)
     
     def get_residues(self) -> Generator[ResidueEnsemble, None, None]:
         """ Returns a generator for all residues in the class """
@@ -120,8 +133,11 @@ class ProteinEnsemble:
         according to their indices """
         for res in new_residues:
             res.protein = self
-            self._residues.append(res)
-        self._residues.sort()
+            # Residues usually arrive in order, so this is mostly an append
+            if self._residues and res < self._residues[-1]:
+                insort(self._residues, res)
+            else:
+                self._residues.append(res)
         # self.__dict__.pop('sequence', None)
         # self.__dict__.pop('dynamics', None)
         # self.__dict__.pop('conformation', None)
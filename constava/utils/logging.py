@@ -1,35 +1,27 @@
 import logging
-import logging.config
+import sys
 
-logger_configuration = {
-    "version" : 1,
-    "formatters" : {
-        "default": {
-            "format" : "[{asctime}] {message}",
-            "datefmt" : "%Y-%m-%d %H:%M:%S",
-            "style" : "{",
-            "validate" : True
-        },
-    },
-    "handlers" : {
-        "console" : {
-            "class" : "logging.StreamHandler",
-            "formatter" : "default",
-            "stream": "ext://sys.stdout",
-        },
-        "null" : {
-            "class" : "logging.NullHandler",
-        }
-    },
-    "loggers" : {
-        "Constava" : {
-            "handlers" : ["console"],
-            "level" : "WARNING",
-        },
-        "Dummy" : {
-            "handlers" : ["null"],
-        },
-    },
-}
+# The level is set on import, while the handler is only set up on request.
+# Later changes of the level (e.g., through `verbose`) are thus kept.
+logging.getLogger("Constava").setLevel(logging.WARNING)
+_configured = False
 
-logging.config.dictConfig(logger_configuration)
+def configure_logging():
+    """Sets up the `Constava` logger to write to stdout. This is called by the
+    command line interface (and the unit tests) only. Library users, who want
+    the console output controlled by `verbose`, opt in by calling it once:
+
+        from constava.utils.logging import configure_logging
+        configure_logging()
+
+    Calling it again has no effect. Unlike logging.config.dictConfig, this 
+    does not touch the handlers or loggers of the calling application."""
+    global _configured
+    if _configured:
+        return
+    formatter = logging.Formatter(
+        "[{asctime}] {message}", datefmt="%Y-%m-%d %H:%M:%S", style="{", validate=True)
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(formatter)
+    logging.getLogger("Constava").addHandler(handler)
+    _configured = True
@@ -8,13 +8,15 @@ a while ProteinEnsemble.
 """
 
 
+from bisect import bisect_right
 from dataclasses import dataclass
 from typing import List
 import numpy as np
 from .ensembles import ProteinEnsemble, ResidueEnsemble, EnsembleMismatchError
+from .utils import DATACLASS_SLOTS
 from ..calc.subsampling import SubsamplingABC
 
-@dataclass
+@dataclass(**DATACLASS_SLOTS)
 class ConstavaResultsEntry:
     """Results for a single ResidueEnsemble.
     
@@ -75,5 +77,11 @@ class ConstavaResults:
         """Adds an additional entry to the result class"""
         if new_entry.residue.protein is not self.protein:
             raise EnsembleMismatchError(f"Result for residue {new_entry.residue} does not belong to the given Protein")
-        self.entries.append(new_entry)
-        self.entries.sort(key=lambda x: x.residue.respos)
\ No newline at end of file
+        # Entries are kept sorted by residue index. They usually arrive in 
+        # order, so this is mostly an append (bisect's key= requires py3.10)
+        respos = new_entry.residue.respos
+        if self.entries and self.entries[-1].residue.respos > respos:
+            idx = bisect_right([entry.residue.respos for entry in self.entries], respos)
+            self.entries.insert(idx, new_entry)
+        else:
+            self.entries.append(new_entry)
\ No newline at end of file
@@ -1,7 +1,35 @@
 """Stand-alone functions that are used in multiple submodules"""
 
+import sys
 from warnings import warn
 import numpy as np
+try:
+    from numba import njit
+except ImportError: # numba is optional, numpy is used as a fallback
+    njit = None
+
+# Keyword arguments to declare dataclasses with __slots__ where supported 
+# (python>=3.10), e.g.: @dataclass(**DATACLASS_SLOTS)
+DATACLASS_SLOTS = {"slots": True} if sys.version_info >= (3, 10) else {}
+
+# Upper bound of dihedrals that were converted to radians twice: pi*pi/180
+PI_IN_RADIANS = np.pi * np.pi / 180.
+
+if njit is not None:
+    @njit(cache=True)
+    def _minmax(flat: np.ndarray):
+        """Returns minimum and maximum of a 1D-array in a single pass"""
+        vmin = vmax = flat[0]
+        for v in flat:
+            if v < vmin:
+                vmin = v
+            elif v > vmax:
+                vmax = v
+        return vmin, vmax
+else:
+    def _minmax(flat: np.ndarray):
+        """Returns minimum and maximum of a 1D-array"""
+        return flat.min(), flat.max()
 
 class DihedralRangeError(ValueError):
     """Raised if any dihedral angles are not correctly in radians"""
@@ -22,6 +50,9 @@ def check_dihedral_range(arr: np.ndarray):
 
     Raises:
     -------
+        ValueError
+            If no dihedrals are provided (e.g., a file with only headers)
+
         DihedralRangeError
             If any dihedrals fall outside the range [-pi, pi]
 
@@ -29,10 +60,32 @@ def check_dihedral_range(arr: np.ndarray):
             If all dihedrals fall in the range of [-(pi*pi/180), (pi*pi/180)], 
             as this suggests that angles were converted to radians twice.
     """
-    vmin, vmax = np.min(arr), np.max(arr)
+    if arr.size == 0:
+        # The compiled _minmax does not check for empty arrays
+        raise ValueError("No dihedrals provided: cannot check the range of an empty array")
+    vmin, vmax = _minmax(np.ascontiguousarray(arr).ravel())
     if vmin < -np.pi or vmax > np.pi:
         raise DihedralRangeError(f"Dihedrals outside the range [-pi, pi] detected: [{vmin:.3f}, {vmax:.3f}]")
-    elif vmin >= np.radians(np.pi) and vmax <= np.radians(np.pi):
-        warn(("Provided dihedrals a very small: [{vmin:.3f}, {vmax:.3f}]. "
+    elif vmin >= -PI_IN_RADIANS and vmax <= PI_IN_RADIANS:
+        warn((f"Provided dihedrals a very small: [{vmin:.3f}, {vmax:.3f}]. "
             "Please check that convertion to radians was only applied once."), 
-            DihedralRangeWarning())
+            DihedralRangeWarning)
+
+def degrees_to_radians(arr: np.ndarray) -> np.ndarray:
+    """Helper method that converts dihedral angles from degrees to radians. 
+    The conversion is done in-place, unless the array is read-only or not of 
+    a floating point type.
+    
+    Parameters:
+    -----------
+        arr : Array[N,2]
+            An array of N (phi, psi) pairs in degrees.
+
+    Returns:
+    --------
+        arr : Array[N,2]
+            The same array of N (phi, psi) pairs in radians.
+    """
+    if not arr.flags.writeable or arr.dtype.kind != "f":
+        arr = arr.astype(np.float64)
+    return np.multiply(arr, np.pi / 180., out=arr)
@@ -1 +1 @@
-from .wrapper import Constava, ConstavaParameters
\ No newline at end of file
+from .wrapper import Constava, ConstavaParameters, clear_csmodel_cache
\ No newline at end of file
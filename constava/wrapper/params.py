@@ -1,37 +1,23 @@
-from dataclasses import dataclass, field
+from collections.abc import Iterable
+from dataclasses import dataclass, field, fields
 import typing
 from ..utils.logging import logging
+from ..utils.utils import DATACLASS_SLOTS
 
 logger = logging.getLogger("Constava")
 
-def set_logger_level(func):
-    """Set logger.level while modifying verbose-attribute"""
-    def _inner_(self, __attr, __value):
-        rvalue = func(self, __attr, __value)
-        if __attr == "verbose":
-            if __value == 0:
-                logger.setLevel(logging.WARNING)
-            elif __value == 1:
-                logger.setLevel(logging.INFO)
-            else:
-                logger.setLevel(logging.DEBUG)
-        return rvalue
-    return _inner_
-
-def set_single_as_list(func):
-    """Allows list-attributes (e.g., window) to be set with a single value"""
-    def _inner_(self, __attr, __value):
-        dtype = typing.get_type_hints(self).get(__attr, None)
-        if typing.get_origin(dtype) is list:
-            if __value is None:
-                __value = []
-            elif not isinstance(__value, typing.Iterable) or isinstance(__value, str):
-                __value = [__value]
-        return func(self, __attr, __value)
-    return _inner_
+def collect_list_fields(cls):
+    """Class decorator that stores the names of all list-typed attributes as 
+    `_LIST_FIELDS`, so they are resolved once when the class is defined. The
+    types are read from the dataclass fields, so annotations must not be 
+    strings (i.e., no `from __future__ import annotations`)."""
+    cls._LIST_FIELDS = frozenset(
+        f.name for f in fields(cls) if typing.get_origin(f.type) is list)
+    return cls
 
 
-@dataclass
+@collect_list_fields
+@dataclass(eq=False, **DATACLASS_SLOTS)
 class ConstavaParameters:
     """The parameters that govern the function of Constava
     
@@ -44,8 +30,12 @@ class ConstavaParameters:
             - 'auto': Automatically detect the file format (default).
             - 'csv': Comma-separated values format.
             - 'xvg': XVG format used by GROMACS for graphing.
-        output_file : str
-            The file to write the output to.
+        input_dtype : str
+            Precision in which the input dihedrals are stored: 'float64' 
+            (default) or 'float32', which halves the memory of large ensembles.
+        output_file : str or file-like object
+            The file to write the output to. Open file-like objects (e.g., 
+            io.BytesIO) require an explicit `output_format`.
         output_format : str
             Format of the output file. Options include:
             - 'auto': Automatically select the output format based on the input format or other criteria (default).
@@ -53,6 +43,7 @@ class ConstavaParameters:
             - 'json': JSON format, which is lightweight and easy for humans to read and write, and easy for machines
             to parse and generate.
             - 'tsv': Tab-separated values format, useful for tabular data that is less complex than CSV data.
+            - 'parquet': Compressed columnar format, much smaller and faster for long series outputs (requires pyarrow).
         model_type : str
             Specifies the probabilistic conformational state model used. Options include:
             - 'kde': Kernel Density Estimator (default).
@@ -91,13 +82,17 @@ class ConstavaParameters:
         grid_points : int
             When `model_type` == 'grid', this controls how many grid points
             are used to describe the probability density function.
+        grid_dtype : str
+            When `model_type` == 'grid', the precision of the grid: 'float64'
+            (default) or 'float32', which halves the memory of the grid.
         seed : int
             Set the random seed especially for bootstrapping.
     """
     # Input/Output Options
     input_files : typing.List[str] = field(default_factory=list)
     input_format : str = "auto"
-    output_file : str = None
+    input_dtype : str = "float64"
+    output_file : typing.Union[str, typing.IO] = None
     output_format : str = "auto"
 
     # Conformational State Model Options
@@ -119,14 +114,29 @@ class ConstavaParameters:
     precision : int = 4
     kde_bandwidth : float = .13
     grid_points : int = 10_000
+    grid_dtype : str = "float64"
     seed : int = None
     verbose : int = 0
 
     # References to the owning Constava object, not to be set by user
-    _constava = None
+    _constava : typing.Any = field(default=None, init=False, repr=False)
 
-    @set_logger_level
-    @set_single_as_list
     def __setattr__(self, __attr, __value) -> None:
-        """Custom function to set attributes, to catch certain special behaviours"""
-        super().__setattr__(__attr, __value)
+        """Custom function to set attributes, to catch certain special behaviours:
+        list-attributes (e.g., window) can be set with a single value, and 
+        setting `verbose` sets the level of the logger."""
+        if __attr in self._LIST_FIELDS:
+            if __value is None:
+                __value = []
+            elif isinstance(__value, list):
+                pass
+            elif isinstance(__value, str) or not isinstance(__value, Iterable):
+                __value = [__value]
+        object.__setattr__(self, __attr, __value)
+        if __attr == "verbose":
+            if __value == 0:
+                logger.setLevel(logging.WARNING)
+            elif __value == 1:
+                logger.setLevel(logging.INFO)
+            else:
+                logger.setLevel(logging.DEBUG)
@@ -1,46 +1,121 @@
+import hashlib
 import os
+import pickle
+import weakref
 from typing import List
+import numpy as np
 
-from ..utils.constants import DEFAULT_TRAINING_DATA_PATH
+from ..utils.constants import DEFAULT_TRAINING_DATA_PATH, CONSTAVA_CACHE_DIR, CONSTAVA_VERSION
 from ..utils.logging import logging
 from .params import ConstavaParameters
 from ..io import ResultsWriter, EnsembleReader
 from ..calc.calculator import ConfStateCalculator
 from ..calc.subsampling import SubsamplingBootstrap, SubsamplingBootstrapSeries, SubsamplingWindow, \
 	SubsamplingWindowSeries
-from ..calc.csmodels import ConfStateModelABC, ConfStateModelKDE, ConfStateModelGrid
+from ..calc.csmodels import ConfStateModelABC, ConfStateModelKDE, ConfStateModelGrid, ConfStateModelLoadingError
 
 # The logger for the wrapper
 logger = logging.getLogger("Constava")
 
 
+def _load_cskey(args, kwargs) -> tuple:
+	"""Returns the parameters of a `load_csmodel` call that identify the model"""
+	return _file_signature(
+		args[0] if len(args) > 0 else kwargs.get("pickled_csmodel", None))
+
+def _fit_cskey(args, kwargs) -> tuple:
+	"""Returns the parameters of a `fit_csmodel` call that identify the model"""
+	return (
+		args[0] if len(args) > 0 else kwargs.get("model_type", "kde"),
+		*_file_signature((args[1] if len(args) > 1 else kwargs.get("model_data", None)) 
+		                 or DEFAULT_TRAINING_DATA_PATH),
+		args[2] if len(args) > 2 else kwargs.get("kde_bandwidth", .13),
+		args[3] if len(args) > 3 else kwargs.get("grid_points", 10_000),
+		args[4] if len(args) > 4 else kwargs.get("model_data_degrees", False),
+		args[5] if len(args) > 5 else kwargs.get("grid_dtype", "float64"),)
+
+# Functions to extract the model parameters from the arguments of the methods
+# decorated with `cache_csmodel`
+_CSKEY_EXTRACTORS = {
+	"load_csmodel": _load_cskey,
+	"fit_csmodel": _fit_cskey,
+}
+
+
 def cache_csmodel(func):
 	"""Decorator for caching conformational state models"""
+	# The extractor is resolved once, when the method is decorated
+	try:
+		extract_cskey = _CSKEY_EXTRACTORS[func.__name__]
+	except KeyError:
+		raise TypeError("Decorator `cache_csmodel` only works with `load_csmodel` and `fit_csmodel`") from None
+	name = func.__name__
 
 	def __inner(self: "Constava", *args, **kwargs):
-		if func.__name__ == "load_csmodel":
-			new_cshash = hash((
-				args[0] if len(args) > 0 else kwargs.get("pickled_csmodel", None),))
-		elif func.__name__ == "fit_csmodel":
-			new_cshash = hash((
-				args[0] if len(args) > 0 else kwargs.get("model_type", "kde"),
-				args[1] if len(args) > 1 else kwargs.get("model_data", None),
-				args[2] if len(args) > 2 else kwargs.get("kde_bandwidth", .13),
-				args[3] if len(args) > 3 else kwargs.get("grid_points", 10_000),
-				args[4] if len(args) > 4 else kwargs.get("model_data_degrees", False),))
-		else:
-			raise TypeError("Decorator `cache_csmodel` only works with `load_csmodel` and `fit_csmodel`")
-
-		if self._cshash == new_cshash:
+		# The parameters are compared as a plain tuple, rather than hashed,
+		# which is cheaper and cannot collide
+		# Files are identified by their path and modification, so that changed 
+		# files are read again
+		new_cskey = (name, *extract_cskey(args, kwargs))
+		if self._csmodel is not None and self._cskey == new_cskey:
 			logger.info("No change to model parameters. Using preloaded model.")
 		else:
 			csmodel = func(self, *args, **kwargs)
-			self._csmodel, self._cshash = csmodel, new_cshash
+			self._csmodel, self._cskey = csmodel, new_cskey
 		return self._csmodel
 
 	return __inner
 
 
+def _file_signature(path: str) -> tuple:
+	"""Returns the absolute path, modification time and size of a file. If 
+	the file cannot be accessed, only the path is returned (and reading it 
+	will fail later)."""
+	try:
+		stat = os.stat(path)
+	except (OSError, TypeError, ValueError):
+		return (path, None, None)
+	return (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+
+
+# Models currently held by any Constava object. They are immutable once 
+# created, so objects loading or fitting the same model share it. Models no 
+# longer held by any object are released.
+_SHARED_CSMODELS = weakref.WeakValueDictionary()
+
+def _shared_csmodel(key: tuple, create) -> ConfStateModelABC:
+	"""Returns the shared model stored under `key`, or creates it with 
+	`create()` and shares it."""
+	csmodel = _SHARED_CSMODELS.get(key)
+	if csmodel is None:
+		csmodel = _SHARED_CSMODELS[key] = create()
+	else:
+		logger.info(f"... reusing model of another Constava object: {csmodel}")
+	return csmodel
+
+def clear_csmodel_cache():
+	"""Stops sharing the models loaded or fitted so far, so that new Constava
+	objects load or fit them again (e.g., to test loading from disk). Models
+	already held by Constava objects are kept by those objects."""
+	_SHARED_CSMODELS.clear()
+
+
+def _csmodel_cache_file(cache_dir: str, model_data: str, PdfModel: type, fit_kwargs: dict) -> str:
+	"""Returns the path under which a model of class `PdfModel` fitted to 
+	`model_data` with the arguments `fit_kwargs` is cached. The key is a hash
+	of the training data, the model class, all fitting arguments and the 
+	Constava version. Returns None if caching is disabled."""
+	if not cache_dir:
+		return None
+	hasher = hashlib.sha256()
+	with open(model_data, "rb") as fhandle:
+		for chunk in iter(lambda: fhandle.read(1 << 20), b""):
+			hasher.update(chunk)
+	hasher.update(repr((CONSTAVA_VERSION, PdfModel.__name__, 
+	                    sorted(fit_kwargs.items()))).encode("utf-8"))
+	return os.path.join(cache_dir, f"{hasher.hexdigest()}.pkl")
+
+
 class Constava:
 	"""Interface class for all functionalities of Constava. This tool allows the probabilistic description of protein
 	conformation from a set of density-defined conformational states. Six solution NMR-defined conformational states
@@ -63,9 +138,9 @@ class Constava:
             Returns the current set of parameters as a string.
 
 		# Methods to access sub-functionalities of the Constava toolkit.
-		initialize_reader(format="auto", in_degrees=False):
-            Initializes an EnsembleReader for reading input files, with the format specified by 'format' and whether
-            the data is in degrees specified by 'in_degrees'.
+		initialize_reader(format="auto", in_degrees=False, dtype="float64"):
+            Initializes an EnsembleReader for reading input files, with the format specified by 'format', whether
+            the data is in degrees specified by 'in_degrees', and the precision specified by 'dtype'.
         initialize_writer(outfile, format="auto", float_precision=4):
             Initializes a ResultsWriter for writing output results to a file specified by 'outfile', in the format
             specified by 'format', and with float precision specified by 'float_precision'.
@@ -91,6 +166,7 @@ class Constava:
         result = c.run()
         ```
     """
+	__slots__ = ("parameters", "results", "_csmodel", "_cskey", "_calculator", "_calculator_key")
 
 	def __init__(self, parameters: ConstavaParameters = None, **kwargs):
 		"""Initializes the python interface for Constava. Parameters can be
@@ -114,7 +190,9 @@ class Constava:
 		self.parameters = parameters
 		self.results = None
 		self._csmodel = None  # Preloaded conformational state models
-		self._cshash = None  # Hashed parameters of the models
+		self._cskey = None  # Parameters of the preloaded models
+		self._calculator = None  # Calculator of the previous run
+		self._calculator_key = None  # Parameters of that calculator
 
 	def get_param(self, parameter: str):
 		"""Returns the current value of the given parameter"""
@@ -126,7 +204,8 @@ class Constava:
 
 		logger.info(f"Setting `{parameter} = {value}`")
 		setattr(self.parameters, parameter, value)
-		logger.debug(f"New parameters: {self.show_params()}")
+		if logger.isEnabledFor(logging.DEBUG):
+			logger.debug(f"New parameters: {self.show_params()}")
 
 	def unset_param(self, parameter: str):
 		"""Sets a parameter to None"""
@@ -141,54 +220,76 @@ class Constava:
         state variabilites with the given parameters."""
 		# Reset results
 		self.results = None
+		params = self.parameters
+
+		# Check for input, before any model is fitted or loaded
+		input_files = params.input_files
+		if not input_files:
+			raise ValueError("No input files provided. Please, set `input_files`.")
 
 		# Initialize a reader for input file(s)
 		reader = self.initialize_reader(
-			format=self.get_param("input_format"),
-			in_degrees=self.get_param("input_degrees"))
+			format=params.input_format,
+			in_degrees=params.input_degrees,
+			dtype=params.input_dtype)
 
 		# Initialize writer for results
 		writer = self.initialize_writer(
-			outfile=self.get_param("output_file"),
-			format=self.get_param("output_format"),
-			float_precision=self.get_param("precision"))
+			outfile=params.output_file,
+			format=params.output_format,
+			float_precision=params.precision)
 
 		# Fit or load a conformational state model
-		if os.path.isfile(self.get_param("model_load") or ""):
-			csmodel = self.load_csmodel(pickled_csmodel=self.get_param("model_load"))
+		if params.model_load and os.path.isfile(params.model_load):
+			csmodel = self.load_csmodel(pickled_csmodel=params.model_load)
 		else:
 			csmodel = self.fit_csmodel(
-				model_type=self.get_param("model_type"),
-				model_data=self.get_param("model_data"),
-				kde_bandwidth=self.get_param("kde_bandwidth"),
-				grid_points=self.get_param("grid_points"),
-				model_data_degrees=self.get_param("model_data_degrees"))
-
-		# Initialize a calculator (logged inside function)
-		calculator = self.initialize_calculator(
+				model_type=params.model_type,
+				model_data=params.model_data,
+				kde_bandwidth=params.kde_bandwidth,
+				grid_points=params.grid_points,
+				model_data_degrees=params.model_data_degrees,
+				grid_dtype=params.grid_dtype)
+
+		# Initialize a calculator (logged inside function), unless the one of 
+		# the previous run has the same parameters
+		calculator = self._get_calculator(
 			csmodel=csmodel,
-			window=self.get_param("window"),
-			window_series=self.get_param("window_series"),
-			bootstrap=self.get_param("bootstrap"),
-			bootstrap_series=self.get_param("bootstrap_series"),
-			bootstrap_samples=self.get_param("bootstrap_samples"),
-			bootstrap_seed=self.get_param("seed"))
+			window=params.window,
+			window_series=params.window_series,
+			bootstrap=params.bootstrap,
+			bootstrap_series=params.bootstrap_series,
+			bootstrap_samples=params.bootstrap_samples,
+			bootstrap_seed=params.seed)
 
 		# Read input files
-		input_files = self.get_param("input_files")
 		logger.info(f"Reading dihedrals from {len(input_files)} files...")
-		logger.debug("\n\t*  ".join(["... input file list:", *input_files]))
+		if logger.isEnabledFor(logging.DEBUG):
+			logger.debug("\n\t*  ".join(["... input file list:", *input_files]))
 		ensemble = reader.readFiles(*input_files)
 
 		# Do the inference
 		logger.info("Starting inference...")
 		self.results = calculator.calculate(ensemble)
 
-		# Write results
-		logger.info(f"Writing results to file: {writer.filename}")
-		writer.write_results(self.results)
-
-	def initialize_reader(self, format: str = "auto", in_degrees: bool = False) -> EnsembleReader:
+		# Write results (if an output file is set)
+		if writer is not None:
+			logger.info(f"Writing results to file: {writer.filename}")
+			writer.write_results(self.results)
+
+	def _get_calculator(self, **kwargs) -> ConfStateCalculator:
+		"""Returns the calculator of the previous run, if it was initialized 
+		with the same parameters (see `initialize_calculator`), or initializes
+		a new one. Subsampling methods thus keep their cached bootstrap samples."""
+		key = tuple((name, tuple(value) if isinstance(value, list) else value) 
+		            for name, value in sorted(kwargs.items()))
+		if self._calculator is None or self._calculator_key != key:
+			self._calculator = self.initialize_calculator(**kwargs)
+			self._calculator_key = key
+		return self._calculator
+
+	def initialize_reader(self, format: str = "auto", in_degrees: bool = False,
+	                      dtype: str = "float64") -> EnsembleReader:
 		"""Initializes an EnsembleReader.
         
         Parameters:
@@ -197,6 +298,9 @@ class Constava:
                 File format of the files to be read. {'auto', 'csv', 'xvg'}
             in_degrees: bool
                 Set `True` if input files are in degrees,
+            dtype: str
+                Precision in which the dihedrals are stored: {'float64', 
+                'float32'}. 'float32' halves the memory of large ensembles.
         
         Returns:
         --------
@@ -204,8 +308,11 @@ class Constava:
                 An EnsembleReader object.
         """
 		logger.info("Initializing reader for input file(s)...")
-		logger.debug(f"... setting reader parameters: {format=}, {in_degrees=}")
-		reader = EnsembleReader(filetype_str=format, degrees2radians=in_degrees)
+		if dtype not in ("float64", "float32"):
+			raise ValueError(f"Unknown dtype: '{dtype}'. Options: 'float64', 'float32'")
+		logger.debug(f"... setting reader parameters: {format=}, {in_degrees=}, {dtype=}")
+		reader = EnsembleReader(filetype_str=format, degrees2radians=in_degrees, 
+		                        dtype=getattr(np, dtype))
 		return reader
 
 	def initialize_writer(self, outfile, format: str = "auto", float_precision: int = 4) -> ResultsWriter:
@@ -213,11 +320,12 @@ class Constava:
         
         Parameters:
         -----------
-            outfile: str
-                The file path to write results to. File extension is used to infer
-                the output format, if not provided explicitly.
+            outfile: str or file-like object
+                The file path or open file object to write results to. File 
+                extension is used to infer the output format, if not provided 
+                explicitly.
             format: str
-                Format in which the results should be written out. {'auto', 'csv', 'json'}
+                Format in which the results should be written out. {'auto', 'csv', 'json', 'tsv', 'parquet'}
             float_precision: int
                 Sets de number of decimals in the output files. By default, 4 decimal.
         
@@ -236,8 +344,13 @@ class Constava:
 	@cache_csmodel
 	def fit_csmodel(self, model_type: str = "kde", model_data: str = None,
 	                kde_bandwidth: float = .13, grid_points: int = 10_000,
-	                model_data_degrees: bool = False) -> ConfStateModelABC:
-		"""Fits a conformational state model to the provided data.
+	                model_data_degrees: bool = False, grid_dtype: str = "float64",
+	                cache_dir: str = None) -> ConfStateModelABC:
+		"""Fits a conformational state model to the provided data. If a cache
+        directory is given (or set by the environment variable 
+        CONSTAVA_CACHE_DIR), fitted models are cached there, so fitting to the 
+        same data with the same parameters again loads the cached model. 
+        Constava objects in the same process share their models.
         
         Parameters:
         -----------
@@ -256,27 +369,66 @@ class Constava:
             model_data_degrees : bool
                 Set `True` if the data given under `model_data` to is given in 
                 degrees. (default: False)
+            grid_dtype : str
+                When `model_type` == 'grid', the precision of the grid: 
+                {'float64', 'float32'}. 'float32' halves the memory of the 
+                grid at a small loss of accuracy. (default: 'float64')
+            cache_dir : str
+                Directory in which fitted models are cached. Only use trusted
+                directories, as cached models are unpickled. (default: the
+                value of CONSTAVA_CACHE_DIR, if unset models are not cached)
 
         Returns:
         --------
             csmodel : ConfStateModelABC
                 Probabilistic model describing the conformational states
         """
-		PdfModel = {"kde": ConfStateModelKDE, "grid": ConfStateModelGrid}[model_type]
+		if grid_dtype not in ("float64", "float32"):
+			raise ValueError(f"Unknown grid_dtype: '{grid_dtype}'. Options: 'float64', 'float32'")
 		model_data = (model_data or DEFAULT_TRAINING_DATA_PATH)
+		key = ("fit", model_type, *_file_signature(model_data), 
+		       kde_bandwidth, grid_points, model_data_degrees, grid_dtype)
+		return _shared_csmodel(key, lambda: self._fit_csmodel(
+			model_type, model_data, kde_bandwidth, grid_points, model_data_degrees,
+			grid_dtype, CONSTAVA_CACHE_DIR if cache_dir is None else cache_dir))
+
+	def _fit_csmodel(self, model_type: str, model_data: str, kde_bandwidth: float, 
+	                 grid_points: int, model_data_degrees: bool, grid_dtype: str,
+	                 cache_dir: str) -> ConfStateModelABC:
+		"""Fits a conformational state model, or loads it from the on-disk 
+		cache (see `fit_csmodel`)"""
+		PdfModel = {"kde": ConfStateModelKDE, "grid": ConfStateModelGrid}[model_type]
+		# All arguments of the fit are part of the cache key
+		fit_kwargs = dict(in_degrees=model_data_degrees, bandwidth=kde_bandwidth,
+		                  grid_points=grid_points, dtype=getattr(np, grid_dtype))
+		cache_file = _csmodel_cache_file(cache_dir, model_data, PdfModel, fit_kwargs)
+		if cache_file is not None and os.path.isfile(cache_file):
+			try:
+				csmodel = PdfModel.from_pickle(cache_file)
+			except (OSError, EOFError, pickle.UnpicklingError, ConfStateModelLoadingError) as err:
+				logger.warning(f"Ignoring unreadable cached model {cache_file}: {err}")
+			else:
+				logger.info(f"... model loaded from cache: {csmodel}")
+				return csmodel
 		logger.info(f"Fitting model to data in: {model_data}")
-		csmodel = PdfModel.from_fitting(
-			model_data,
-			in_degrees=model_data_degrees,
-			bandwidth=kde_bandwidth,
-			grid_points=grid_points)
+		csmodel = PdfModel.from_fitting(model_data, **fit_kwargs)
 		logger.info(f"... model fitted: {csmodel}")
+		if cache_file is not None:
+			# Write to a temporary file first, so concurrent runs never read a
+			# partially written model
+			tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+			try:
+				os.makedirs(cache_dir, exist_ok=True)
+				csmodel.dump_pickle(tmp_file)
+				os.replace(tmp_file, cache_file)
+			except OSError as err:
+				logger.warning(f"Could not cache fitted model: {err}")
 		return csmodel
 
 	@cache_csmodel
 	def load_csmodel(self, pickled_csmodel: str) -> ConfStateModelABC:
 		"""Load a previously fitted conformational state model from a pickled
-        file.
+        file. Constava objects loading the same, unchanged file share the model.
         
         Parameters:
         -----------
@@ -289,9 +441,11 @@ class Constava:
                 Probabilistic model describing the conformational states
         """
 		logger.info(f"Loading conformational state models from file: {pickled_csmodel}")
-		csmodel = ConfStateModelABC.from_pickle(pickled_csmodel)
-		logger.info(f"... model loaded: {csmodel}")
-		return csmodel
+		def _load():
+			csmodel = ConfStateModelABC.from_pickle(pickled_csmodel)
+			logger.info(f"... model loaded: {csmodel}")
+			return csmodel
+		return _shared_csmodel(("load", *_file_signature(pickled_csmodel)), _load)
 
 	def initialize_calculator(self, csmodel: ConfStateModelABC = None,
 	                          window: List[int] = None, window_series: List[int] = None,